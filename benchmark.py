@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#Benchmarks the pipeline variants stage by stage on synthetic url
+#datasets generated locally. Every (variant, size) pair runs in a fresh
+#process so peak memory is its own, and results go to a json report that can
+#be compared run over run
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import traceback
+from datetime import datetime, timezone
+
+#variant: urlmodel.train model, trained on the labels of its MODELS entry
+VARIANTS = {
+    'rf': 'rf',  # random forest (ArtIntMLModel.py)
+    'xgb': 'xgb',  # xgboost (version2.py)
+    'rf_balanced': 'rf_balanced',  # random forest, class weights in place of oversampling (version3.py)
+}
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+BENIGN_HOSTS = ['google.com', 'youtube.com', 'wikipedia.org', 'github.com', 'bbc.co.uk', 'amazon.com',
+                'utep.edu', 'reddit.com', 'stackoverflow.com', 'nytimes.com']
+MALICIOUS_HOSTS = ['secure-login.ru', 'free-prizes.click', 'account-verify.xyz', 'paypa1.com',
+                   'update-billing.top', 'bit.ly', 'login-appleid.cn']
+WORDS = ['login', 'account', 'free', 'verify', 'home', 'news', 'watch', 'search', 'click here', 'update',
+         'images', 'docs', 'profile', 'signin', 'download', 'index.php', 'wp-admin']
+
+def synthetic_url(rng, malicious):
+    # A quarter of the malicious urls sit on compromised benign hosts so the
+    # task is not separable by host alone
+    hosts = MALICIOUS_HOSTS if malicious and rng.random() < 0.75 else BENIGN_HOSTS
+    host = rng.choice(hosts)
+    if rng.random() < 0.4:
+        host = f"{rng.choice(['www', 'mail', 'secure', 'm', 'cdn'])}.{host}"
+    if malicious and rng.random() < 0.3:
+        host = f"{rng.choice(BENIGN_HOSTS)}.{host}"  # brand name in a subdomain
+    path = '/'.join(rng.choice(WORDS) for _ in range(rng.randint(0, 4)))
+    query = f"?id={rng.randint(0, 10**6)}" if rng.random() < 0.3 else ''
+    scheme = rng.choice(['http://', 'https://', '']) if malicious else rng.choice(['https://', 'https://', ''])
+    return f"{scheme}{host}/{path}{query}"
+
+def generate_dataset(path, rows, seed=42, malicious_rate=0.2):
+    # Same layout cleandata.py writes: a url,label header then 1/0 labels
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('url,label\n')
+        for _ in range(rows):
+            malicious = rng.random() < malicious_rate
+            url = synthetic_url(rng, malicious)
+            if ',' in url or '"' in url:
+                url = '"' + url.replace('"', '""') + '"'
+            f.write(f"{url},{int(malicious)}\n")
+
+def _peak_rss_mb():
+    # the pipeline stages reset the kernel's high-water mark, instrumentation keeps the process peak
+    from urlmodel import instrumentation
+    return instrumentation.process_peak_mb()
+
+def _run_variant(variant, filename, rows, cache_dir, results):
+    # Runs in a child process. The feature cache points at an empty directory
+    # so extraction is measured instead of a cache hit
+    os.environ['URL_FEATURE_CACHE'] = cache_dir
+    os.environ['URL_TRACE'] = '1'  # finer load/extract/scale/... stages from the pipeline itself
+    record = {'variant': variant, 'model': VARIANTS[variant], 'rows': rows, 'stages': {}}
+    try:
+        from sklearn.metrics import accuracy_score
+
+        def stage(name, func, *args):
+            started, cpu_started = time.perf_counter(), time.process_time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                value = func(*args)
+            elapsed = time.perf_counter() - started
+            record['stages'][name] = {
+                'seconds': elapsed,
+                'cpu_seconds': time.process_time() - cpu_started,
+                'rows_per_second': rows / elapsed if elapsed else None,
+                'peak_rss_mb': _peak_rss_mb(),
+            }
+            return value
+
+        # xgboost is imported by the train stage, the first time an xgboost model is made
+        train = stage('import', importlib.import_module, 'urlmodel.train')
+        kind = VARIANTS[variant]
+        X_train, X_test, y_train, y_test = stage('preprocess', train.preprocess_data, filename, train.MODELS[kind])
+        model = stage('train', train.train_model, X_train, y_train, kind)
+        y_pred = stage('predict', model.predict, X_test)
+        record['accuracy'] = float(accuracy_score(y_test, y_pred))
+        record['train_seconds'] = record['stages']['train']['seconds']
+        record['peak_rss_mb'] = _peak_rss_mb()
+        from urlmodel import instrumentation
+        record['pipeline_stages'] = instrumentation.records()
+        record['status'] = 'ok'
+    except ImportError as e:
+        record['status'] = f"skipped: {e}"
+    except Exception as e:
+        record['status'] = f"failed: {e}"
+        record['traceback'] = traceback.format_exc()
+    results.put(record)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(sizes=DEFAULT_SIZES, variants=tuple(VARIANTS), seed=42, workdir=None):
+    # a workdir passed in belongs to the caller, only the files written into it are removed
+    created = workdir is None
+    workdir = tempfile.mkdtemp(prefix='url-benchmark-') if created else workdir
+    os.makedirs(workdir, exist_ok=True)
+    filename = cache_dir = None
+    context = multiprocessing.get_context('spawn')
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'results': [],
+    }
+    try:
+        for rows in sizes:
+            filename = os.path.join(workdir, f"synthetic-{rows}.csv")
+            started = time.perf_counter()
+            generate_dataset(filename, rows, seed)
+            print(f"Generated {rows} rows in {time.perf_counter() - started:.1f}s")
+            for variant in variants:
+                cache_dir = tempfile.mkdtemp(prefix='cache-', dir=workdir)
+                results = context.Queue()
+                process = context.Process(target=_run_variant, args=(variant, filename, rows, cache_dir, results))
+                process.start()
+                record = None
+                while record is None and (process.is_alive() or not results.empty()):
+                    try:
+                        record = results.get(timeout=1)
+                    except queue.Empty:
+                        pass
+                process.join()
+                if record is None:
+                    record = {'variant': variant, 'rows': rows, 'status': f"crashed with exit code {process.exitcode}"}
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                report['results'].append(record)
+                stages = ' '.join(f"{name}={stage['seconds']:.2f}s" for name, stage in record.get('stages', {}).items())
+                print(f"  {variant:15s} {record['status']:8s} {stages} accuracy={record.get('accuracy')}"
+                      f" peak_rss={record.get('peak_rss_mb')}")
+            os.remove(filename)
+    finally:
+        if created:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            if cache_dir is not None:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            if filename is not None and os.path.exists(filename):
+                os.remove(filename)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline variants on synthetic urls")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="dataset sizes in rows, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_report.json')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.variants, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#Two stage scorer: a small random forest looks at every url and answers the
+#ones it is sure about, only urls whose malicious probability falls inside
+#an uncertainty band go on to the xgboost model. The band is calibrated on a
+#validation split carved out of the training rows: the widest early exit
+#that still keeps validation accuracy at the target
+
+import argparse
+import sys
+import time
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from urlmodel import extract
+from urlmodel.artifacts import save_model
+from urlmodel.cascade import CascadeModel, calibrate_band
+from urlmodel.instrumentation import stage
+from urlmodel.train import train_model
+
+VALIDATION_SIZE = 0.2  # of the training rows, used to calibrate the band
+ACCURACY_TOLERANCE = 0.002  # default target: second stage validation accuracy minus this
+
+def train_fast_model(X_train, y_train):
+    model = RandomForestClassifier(n_estimators=10, max_depth=12, random_state=42)
+    with stage('train_fast', rows=len(X_train)):
+        model.fit(X_train, y_train)
+    return model
+
+def train_slow_model(X_train, y_train):
+    return train_model(X_train, y_train, 'xgb')
+
+def preprocess_data(filename):
+    # Rows labeled 0 or 1, split like the other pipelines
+    return extract.preprocess_data(filename, 'binary', return_scaler=True)
+
+def build_cascade(X_train, y_train, target_accuracy=None):
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=VALIDATION_SIZE, random_state=42)
+    fast = train_fast_model(X_fit, y_fit)
+    slow = train_slow_model(X_fit, y_fit)
+    with stage('calibrate', rows=len(X_val)):
+        fast_proba = fast.predict_proba(X_val)
+        positive = list(fast.classes_).index(1)
+        fast_correct = fast.classes_.take(fast_proba.argmax(axis=1)) == y_val.to_numpy()
+        slow_correct = slow.predict(X_val) == y_val.to_numpy()
+        if target_accuracy is None:
+            target_accuracy = slow_correct.mean() - ACCURACY_TOLERANCE
+        low, high = calibrate_band(fast_proba[:, positive], fast_correct, slow_correct, target_accuracy)
+    return CascadeModel(fast, slow, low, high), target_accuracy
+
+def _rows_per_second(predict, X, repeat=3):
+    best = min(_timed(predict, X) for _ in range(repeat))
+    return len(X) / best
+
+def _timed(predict, X):
+    started = time.perf_counter()
+    predict(X)
+    return time.perf_counter() - started
+
+def evaluate_cascade(model, X_test, y_test):
+    y_true = y_test.to_numpy()
+    early_exit = 1 - model.uncertain(model.fast.predict_proba(X_test)).mean()
+    cascade_rate = _rows_per_second(model.predict_proba, X_test)
+    slow_rate = _rows_per_second(model.slow.predict_proba, X_test)
+    return {
+        'band': [model.low, model.high],
+        'early_exit_fraction': float(early_exit),
+        'accuracy_cascade': float(accuracy_score(y_true, model.predict(X_test))),
+        'accuracy_fast': float(accuracy_score(y_true, model.fast.predict(X_test))),
+        'accuracy_slow': float(accuracy_score(y_true, model.slow.predict(X_test))),
+        'rows_per_second_cascade': cascade_rate,
+        'rows_per_second_slow': slow_rate,
+        'throughput_gain': cascade_rate / slow_rate,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a random forest -> xgboost cascade with early exit")
+    parser.add_argument('filename', nargs='?', default='cleaned_data.csv')
+    parser.add_argument('--target-accuracy', type=float,
+                        help=f"validation accuracy to keep, default the xgboost accuracy minus {ACCURACY_TOLERANCE}")
+    parser.add_argument('--output', default='model_artifact_cascade')
+    args = parser.parse_args()
+
+    try:
+        X_train, X_test, y_train, y_test, scaler = preprocess_data(args.filename)
+    except FileNotFoundError:
+        print(f"The file {args.filename} was not found.")
+        sys.exit(1)
+    model, target = build_cascade(X_train, y_train, args.target_accuracy)
+    save_model(args.output, model, scaler, list(X_train.columns))
+    report = evaluate_cascade(model, X_test, y_test)
+    print(f"Uncertainty band: {model.low:.3f} < p < {model.high:.3f} (target validation accuracy {target:.4f})")
+    print(f"Early exit: {report['early_exit_fraction']:.1%} of test urls never reach xgboost")
+    print(f"Accuracy: cascade {report['accuracy_cascade']:.4f}, forest {report['accuracy_fast']:.4f},"
+          f" xgboost {report['accuracy_slow']:.4f}")
+    print(f"Throughput: cascade {report['rows_per_second_cascade']:.0f} rows/s, xgboost alone"
+          f" {report['rows_per_second_slow']:.0f} rows/s ({report['throughput_gain']:.2f}x)")
+    print(f"Model written to {args.output}")
@@ -1,8 +1,18 @@
 #!/usr/bin/env python3
 
+import csv
+import heapq
+import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
+LABELS = {'bad': 1, 'good': 0}
+CHUNK_ROWS = 500_000
+BUCKET_BYTES = 64 * 1024 * 1024  # rough size of each spilled bucket
+
 def load_and_clean_data(filename):
     try:
         # Load data assuming the first row is the header
@@ -13,7 +23,7 @@ def load_and_clean_data(filename):
         print(data.head())
 
         # Encode labels: 'bad' as 1 (malicious) and 'good' as 0 (benign)
-        data['label'] = data['label'].map({'bad': 1, 'good': 0})
+        data['label'] = data['label'].map(LABELS)
 
         # Drop duplicates
         data = data.drop_duplicates()
@@ -37,6 +47,94 @@ def load_and_clean_data(filename):
         print("An unexpected error occurred:", e)
         sys.exit(1)
 
+def _clean_bucket(bucket_path, columns):
+    # Rows are spilled in file order, so keep='first' keeps the same row the
+    # in-memory drop_duplicates would keep
+    bucket = pd.read_csv(bucket_path, header=None, names=['row'] + columns, dtype=str, keep_default_na=False)
+    bucket = bucket.drop_duplicates(subset=columns)
+    bucket.to_csv(bucket_path, index=False, header=False)
+    return len(bucket), bucket['label'].value_counts()
+
+def _merged_rows(bucket_paths, float_column=None):
+    # Every bucket is sorted by original row number, merging them restores file
+    # order. float_column: index of an integer column to write as floats
+    files = [open(path, newline='') for path in bucket_paths]
+    try:
+        readers = [((int(row[0]), row[1:]) for row in csv.reader(f)) for f in files]
+        for _, row in heapq.merge(*readers, key=lambda item: item[0]):
+            if float_column is not None and row[float_column]:
+                row[float_column] += '.0'
+            yield row
+    finally:
+        for f in files:
+            f.close()
+
+def clean_data_streaming(filename, output_filename, chunksize=CHUNK_ROWS, buckets=None, n_jobs=None):
+    # Same cleaning as load_and_clean_data without loading the file: rows are
+    # hash partitioned into buckets on disk so duplicates always land in the
+    # same bucket, then the buckets are deduplicated in parallel
+    spill_dir = None
+    try:
+        if buckets is None:
+            buckets = max(1, os.path.getsize(filename) // BUCKET_BYTES + 1)
+        spill_dir = tempfile.mkdtemp(prefix='cleandata-', dir=os.path.dirname(os.path.abspath(output_filename)))
+        bucket_paths = [os.path.join(spill_dir, f"bucket-{i:04d}.csv") for i in range(buckets)]
+        columns = None
+        first_row = 0
+        missing_labels = False
+        for chunk in pd.read_csv(filename, chunksize=chunksize):
+            if columns is None:
+                columns = list(chunk.columns)
+                print("Initial data preview:")
+                print(chunk.head())
+            # Int64 spills 1/0 and empty for unknown labels, the merge writes
+            # floats instead when any label is unknown, as pandas does in memory
+            chunk['label'] = chunk['label'].map(LABELS).astype('Int64')
+            missing_labels = missing_labels or bool(chunk['label'].isna().any())
+            chunk.insert(0, 'row', range(first_row, first_row + len(chunk)))
+            first_row += len(chunk)
+
+            bucket_ids = pd.util.hash_pandas_object(chunk[columns], index=False).to_numpy() % buckets
+            for bucket_id, rows in chunk.groupby(bucket_ids):
+                rows.to_csv(bucket_paths[bucket_id], mode='a', index=False, header=False)
+
+        if columns is None:
+            raise pd.errors.EmptyDataError("No columns to parse from file")
+        bucket_paths = [path for path in bucket_paths if os.path.exists(path)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_clean_bucket, bucket_paths, [columns] * len(bucket_paths)))
+
+        with open(output_filename, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(columns)
+            writer.writerows(_merged_rows(bucket_paths, columns.index('label') if missing_labels else None))
+
+        total_rows = sum(rows for rows, _ in results)
+        # Unmapped labels are empty strings in the buckets, value_counts skips them like NaN
+        distribution = pd.concat([counts for _, counts in results]).groupby(level=0).sum()
+        distribution = distribution.drop('', errors='ignore')
+        distribution.index = distribution.index.astype(float if missing_labels else int)
+        print("\nData preview after cleaning:")
+        print(pd.read_csv(output_filename, nrows=5))
+        print("\nTotal rows after cleaning:", total_rows)
+        print("\nDistribution of labels:")
+        print(distribution.rename('count').rename_axis('label').sort_values(ascending=False))
+        print(f"\nCleaned data saved to {output_filename}")
+        return total_rows, distribution
+
+    except FileNotFoundError:
+        print("Error: The file was not found.")
+        sys.exit(1)
+    except pd.errors.EmptyDataError:
+        print("Error: The file is empty.")
+        sys.exit(1)
+    except Exception as e:
+        print("An unexpected error occurred:", e)
+        sys.exit(1)
+    finally:
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
 def save_cleaned_data(data, output_filename):
     # Explicitly set header and index options when saving to CSV
     data.to_csv(output_filename, index=False, header=True)
@@ -44,10 +142,15 @@ def save_cleaned_data(data, output_filename):
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python cleandata.py <filename>")
+        print("Usage: python cleandata.py <filename> [--stream]")
         sys.exit(1)
 
     input_file = sys.argv[1]
+    if '--stream' in sys.argv[2:]:
+        # Constant memory version for inputs that do not fit in pandas
+        clean_data_streaming(input_file, "cleaned_data.csv")
+        sys.exit(0)
+
     cleaned_data = load_and_clean_data(input_file)
 
     # Optionally save the cleaned data to a new file
@@ -0,0 +1,98 @@
+#Updates a saved model artifact with a day's worth of new labeled urls
+#instead of retraining on the whole history. Random forests grow new trees
+#on the new rows only and retire their oldest trees, xgboost models keep
+#boosting from the saved booster. Either way the cost follows the size of
+#the delta, the features are scaled with the artifact's scaler unchanged
+
+import argparse
+import sys
+import time
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from sklearn.ensemble import RandomForestClassifier
+
+from urlmodel.artifacts import load_model, prepare_features, save_model
+from urlmodel.instrumentation import stage
+
+NEW_TREES = 10  # trees added to a forest per update
+NEW_ROUNDS = 10  # boosting rounds added to an xgboost model per update
+
+def _with_all_classes(X, y, classes):
+    # Every class the model knows has to show up in the fit or sklearn and
+    # xgboost shrink the model's class list. A missing class gets one copy of
+    # the first row with weight 0, which no split or leaf value ever sees
+    missing = [c for c in classes if c not in set(np.unique(y))]
+    weights = np.ones(len(y) + len(missing))
+    if missing:
+        if not len(y):
+            raise ValueError("No labeled rows to train on")
+        X = pd.concat([X, X.iloc[[0] * len(missing)]], ignore_index=True)
+        y = np.concatenate([np.asarray(y), missing])
+        weights[-len(missing):] = 0
+    unknown = set(np.unique(y)) - set(classes)
+    if unknown:
+        raise ValueError(f"Labels {sorted(unknown)} are not classes of the model {list(classes)}")
+    return X, np.asarray(y), weights
+
+def update_forest(model, X_new, y_new, new_trees=NEW_TREES, max_trees=None):
+    # warm_start keeps the fitted trees and only fits the extra ones, on the
+    # new rows. The oldest trees are then dropped so the forest stays at
+    # max_trees (its size before the update by default)
+    max_trees = max_trees or len(model.estimators_)
+    X, y, weights = _with_all_classes(X_new, y_new, model.classes_)
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + new_trees)
+    model.fit(X, y, sample_weight=weights)
+    model.estimators_ = model.estimators_[-max_trees:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
+
+def update_booster(model, X_new, y_new, rounds=NEW_ROUNDS):
+    # xgb_model continues from the saved trees, only the new rounds are fitted
+    X, y, weights = _with_all_classes(X_new, y_new, model.classes_)
+    updated = type(model)(**{**model.get_params(), 'n_estimators': rounds})
+    updated.fit(X, y, sample_weight=weights, xgb_model=model.get_booster())
+    return updated
+
+def load_delta(filename): #new labeled urls in the cleaned_data.csv layout
+    data = pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str}, low_memory=False)
+    data['label'] = pd.to_numeric(data['label'], errors='coerce')
+    data.dropna(subset=['label'], inplace=True)  # the header row and unlabeled rows
+    return data['url'], data['label'].astype(np.int64)
+
+def update_artifact(model_dir, filename, output_dir=None, new_trees=NEW_TREES, rounds=NEW_ROUNDS):
+    artifact = load_model(model_dir, mmap_mode=None)
+    if artifact.feature_engine['name'] != 'dense':
+        raise ValueError(f"Incremental updates need a dense feature model, {model_dir} uses {artifact.feature_engine['name']}")
+    with stage('load') as s:
+        urls, labels = load_delta(filename)
+        s.rows = len(urls)
+    with stage('extract', rows=len(urls)):
+        X_new = prepare_features(artifact, urls).reset_index(drop=True)
+    with stage('train', rows=len(urls)):
+        if isinstance(artifact.model, RandomForestClassifier):
+            model = update_forest(artifact.model, X_new, labels, new_trees)
+        elif hasattr(artifact.model, 'get_booster'):
+            model = update_booster(artifact.model, X_new, labels, rounds)
+        else:
+            raise ValueError(f"Incremental updates are not supported for {type(artifact.model).__name__}")
+    save_model(output_dir or model_dir, model, artifact.scaler, artifact.feature_columns,
+               artifact.scaled_columns, artifact.feature_engine)
+    return model, len(urls)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update a saved model with new labeled urls")
+    parser.add_argument('model_dir', help="artifact written by urlmodel.train (ArtIntMLModel.py, version2.py)")
+    parser.add_argument('delta', help="csv of new labeled urls, same layout as cleaned_data.csv")
+    parser.add_argument('--output', help="write the updated artifact here instead of over model_dir")
+    parser.add_argument('--trees', type=int, default=NEW_TREES, help="trees to add to a random forest")
+    parser.add_argument('--rounds', type=int, default=NEW_ROUNDS, help="boosting rounds to add to xgboost")
+    args = parser.parse_args()
+
+    try:
+        started = time.perf_counter()
+        model, rows = update_artifact(args.model_dir, args.delta, args.output, args.trees, args.rounds)
+        print(f"Updated {args.output or args.model_dir} with {rows} rows in {time.perf_counter() - started:.2f}s")
+    except FileNotFoundError as e:
+        print(f"File not found: {e.filename}")
+        sys.exit(1)
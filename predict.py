@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+#Scores urls with a saved model artifact, one url per line from a file or
+#stdin. The scoring code lives in urlmodel.score, this is its entry point
+
+from urlmodel.score import BATCH_LINES, load_artifact, main, predict_urls, score_stream  # noqa: F401
+
+if __name__ == "__main__":
+    main()
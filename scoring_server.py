@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+#Local HTTP scoring service. Concurrent requests are grouped into micro
+#batches inside a short latency window so the model runs one vectorized
+#predict_proba per batch instead of one call per url. Also has a small load
+#generator so the service can be measured without any outside tools
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import deque
+
+import numpy as np #for data analysis
+
+from urlmodel.score import load_artifact, load_index, predict_urls
+
+MAX_BATCH_SIZE = 256  # urls per model call
+MAX_WAIT_MS = 5.0  # how long the first request in a batch may wait for company
+METRICS_WINDOW = 10_000  # latencies kept for the percentiles
+
+class MicroBatcher:
+    def __init__(self, score_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        # score_batch takes a list of urls and returns (labels, probabilities)
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.latencies = deque(maxlen=METRICS_WINDOW)
+        self.batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self.requests = 0
+        self.batches = 0
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, url): #answers one caller, batching happens behind the scenes
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((url, future))
+        result = await future
+        self.latencies.append(time.perf_counter() - started)
+        self.requests += 1
+        return result
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            urls = [url for url, _ in batch]
+            try:
+                # The model runs in a thread so the event loop keeps accepting requests
+                labels, probabilities = await loop.run_in_executor(None, self.score_batch, urls)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batch_sizes.append(len(batch))
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    probability = None if probabilities is None else float(probabilities[i])
+                    future.set_result((labels[i].item() if hasattr(labels[i], 'item') else labels[i], probability))
+
+    def metrics(self):
+        latencies = np.array(self.latencies) * 1000
+        sizes = np.array(self.batch_sizes)
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batch_size_mean': float(sizes.mean()) if len(sizes) else None,
+            'batch_size_max': int(sizes.max()) if len(sizes) else None,
+        }
+
+async def _read_request(reader): #minimal HTTP/1.1 parsing, returns None when the client is gone
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, headers, body
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (
+        f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+async def _score_one(batcher, url, index):
+    # urls with a known label are answered right away, only misses wait for a batch
+    if index is not None:
+        label = index.lookup(url)
+        if label is not None:
+            return label, float(label)
+    return await batcher.score(url)
+
+def _check_urls(urls):
+    for url in urls:
+        if not isinstance(url, str):
+            raise TypeError(f"url must be a string, got {type(url).__name__}")
+
+async def _score_payload(batcher, payload, index=None):
+    if 'urls' in payload:
+        if not isinstance(payload['urls'], list):
+            raise TypeError("urls must be a list of strings")
+        _check_urls(payload['urls'])
+        results = await asyncio.gather(*(_score_one(batcher, url, index) for url in payload['urls']))
+        return {'results': [{'url': url, 'label': label, 'probability': probability}
+                            for url, (label, probability) in zip(payload['urls'], results)]}
+    _check_urls([payload['url']])
+    label, probability = await _score_one(batcher, payload['url'], index)
+    return {'url': payload['url'], 'label': label, 'probability': probability}
+
+def make_handler(batcher, index=None):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_response('400 Bad Request', {'error': 'malformed request'}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'POST' and path == '/score':
+                    try:
+                        payload = await _score_payload(batcher, json.loads(body), index)
+                        writer.write(_response('200 OK', payload, keep_alive))
+                    except (ValueError, KeyError, TypeError) as e:
+                        writer.write(_response('400 Bad Request', {'error': str(e)}, keep_alive))
+                elif method == 'GET' and path == '/metrics':
+                    metrics = batcher.metrics() if index is None else {**batcher.metrics(), **index.stats()}
+                    writer.write(_response('200 OK', metrics, keep_alive))
+                elif method == 'GET' and path == '/health':
+                    writer.write(_response('200 OK', {'status': 'ok'}, keep_alive))
+                else:
+                    writer.write(_response('404 Not Found', {'error': f"no route for {method} {path}"}, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def serve(model_dir, host='127.0.0.1', port=8080, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                index_dir=None):
+    artifact = load_artifact(model_dir)  # small batches score on the compiled forest
+    batcher = MicroBatcher(lambda urls: predict_urls(artifact, urls), max_batch_size, max_wait_ms)
+    batcher.start()
+    index = load_index(index_dir) if index_dir else None
+    server = await asyncio.start_server(make_handler(batcher, index), host, port)
+    print(f"Scoring on http://{host}:{port}/score (batch size {max_batch_size}, window {max_wait_ms} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+async def _client(host, port, urls, count, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            body = json.dumps({'url': random.choice(urls)}).encode()
+            started = time.perf_counter()
+            writer.write(
+                f"POST /score HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            response = await _read_request(reader)  # status line parses like a request line
+            if response is None:
+                break
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+async def run_load(host, port, urls, requests=10_000, concurrency=64):
+    #keep-alive clients firing single-url requests, returns client side latency stats
+    latencies = []
+    per_client = max(1, requests // concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, urls, per_client, latencies) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else None,
+        'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+def _load_urls(filename):
+    with open(filename) as f:
+        return [line.strip().split(',')[0] for line in f if line.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching url scoring service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="serve a saved model artifact")
+    serve_parser.add_argument('model_dir')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    serve_parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    serve_parser.add_argument('--index', help="known domain index (urlmodel.domain_index) to answer labeled urls from")
+    load_parser = commands.add_parser('load', help="send test traffic to a running server")
+    load_parser.add_argument('urls_file', help="one url per line, or a csv with the url first")
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=8080)
+    load_parser.add_argument('--requests', type=int, default=10_000)
+    load_parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve(args.model_dir, args.host, args.port, args.max_batch_size, args.max_wait_ms,
+                              args.index))
+        except KeyboardInterrupt:
+            pass
+    else:
+        report = asyncio.run(run_load(args.host, args.port, _load_urls(args.urls_file), args.requests, args.concurrency))
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['requests'] else 1)
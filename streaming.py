@@ -0,0 +1,109 @@
+#Streaming version of preprocess_data for files that do not fit in memory.
+#The csv is read in chunks, features are extracted chunk by chunk, the scaler
+#is fit with partial_fit on every row, as compact_split fits it, and every
+#chunk is written to disk as train and test partitions, so memory stays about
+#one chunk no matter how big the input is. Partitions hold the columns
+#compact_split gives (float32 scaled counts, uint8 flags, int32 hashes) and
+#the row positions as index
+
+import glob
+import json
+import os
+import sys
+
+import joblib
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from sklearn.preprocessing import StandardScaler #to normalize features
+
+from urlmodel.feature_frame import ROW_DTYPE
+from urlmodel.features import FEATURE_COLUMNS, FEATURE_DTYPES, SCALED_COLUMNS, extract_features_batch, normalize_urls
+
+CHUNK_ROWS = 500_000
+#one record per row, the scaled counts are stored as float32 from the start
+#(exact for counts below 2**24) so they can be scaled in place
+PARTITION_DTYPE = np.dtype([
+    (name, np.float32 if name in SCALED_COLUMNS else FEATURE_DTYPES[name]) for name in FEATURE_COLUMNS
+])
+
+def _part_path(output_dir, split, part, kind):
+    return os.path.join(output_dir, split, f"{kind}-{part:05d}.npy")
+
+def preprocess_data_streaming(filename, output_dir, chunksize=CHUNK_ROWS, test_size=0.2, random_state=42):
+    try:
+        for split in ('train', 'test'):
+            os.makedirs(os.path.join(output_dir, split), exist_ok=True)
+            # Partitions left over from an earlier run would be mixed into this one
+            for old in glob.glob(os.path.join(output_dir, split, '*.npy')):
+                os.remove(old)
+
+        scaler = StandardScaler()
+        rng = np.random.default_rng(random_state)
+        rows = {'train': 0, 'test': 0}
+        reader = pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str}, chunksize=chunksize)
+
+        # First pass: extract features, fit the scaler and write unscaled partitions
+        part = -1
+        for part, chunk in enumerate(reader):
+            labels = pd.to_numeric(chunk['label'], errors='coerce').fillna(-1).to_numpy()
+            features = extract_features_batch(normalize_urls(chunk['url']))
+            records = np.empty(len(features), dtype=PARTITION_DTYPE)
+            for name in FEATURE_COLUMNS:
+                records[name] = features[name].to_numpy()
+
+            # Rows are assigned to the test set one by one so no global shuffle is needed
+            is_test = rng.random(len(chunk)) < test_size
+            scaler.partial_fit(features[SCALED_COLUMNS].astype(np.float64))
+            for split, mask in (('train', ~is_test), ('test', is_test)):
+                np.save(_part_path(output_dir, split, part, 'X'), records[mask])
+                np.save(_part_path(output_dir, split, part, 'y'), labels[mask])
+                np.save(_part_path(output_dir, split, part, 'rows'), chunk.index.to_numpy()[mask].astype(ROW_DTYPE))
+                rows[split] += int(mask.sum())
+
+        # Second pass: scale every partition in place once the scaler has seen all rows
+        for split in ('train', 'test'):
+            for path in sorted(glob.glob(os.path.join(output_dir, split, 'X-*.npy'))):
+                X = np.load(path, mmap_mode='r+')
+                for j, name in enumerate(SCALED_COLUMNS):
+                    # the float64 arithmetic feature_frame.take_rows does
+                    scaled = X[name].astype(np.float64)
+                    scaled -= scaler.mean_[j]
+                    scaled /= scaler.scale_[j]
+                    X[name] = scaled
+                X.flush()
+                del X
+
+        joblib.dump(scaler, os.path.join(output_dir, 'scaler.joblib'))
+        with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+            json.dump({'columns': FEATURE_COLUMNS, 'parts': part + 1, 'rows': rows}, f, indent=2)
+        return scaler
+    except Exception as e:
+        print(f"Failed to preprocess data: {e}")
+        raise
+
+def iter_partitions(output_dir, split): #yields (X, y) one partition at a time, indexed by row position
+    for path in sorted(glob.glob(os.path.join(output_dir, split, 'X-*.npy'))):
+        X = np.load(path, mmap_mode='r')
+        y = np.load(path.replace(os.sep + 'X-', os.sep + 'y-'), mmap_mode='r')
+        rows = np.load(path.replace(os.sep + 'X-', os.sep + 'rows-'))
+        frame = pd.DataFrame({name: X[name] for name in FEATURE_COLUMNS}, index=rows, columns=FEATURE_COLUMNS)
+        yield frame, pd.Series(y, index=rows, name='label')
+
+def load_split(output_dir, split): #whole split in memory, for data that fits after preprocessing
+    parts = list(iter_partitions(output_dir, split))
+    if not parts:
+        empty = {name: np.empty(0, dtype=PARTITION_DTYPE[name]) for name in FEATURE_COLUMNS}
+        return pd.DataFrame(empty, columns=FEATURE_COLUMNS), pd.Series(name='label', dtype=float)
+    X = pd.concat([X for X, _ in parts])
+    y = pd.concat([y for _, y in parts])
+    return X, y
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python streaming.py <filename> <output_dir> [chunksize]")
+        sys.exit(1)
+
+    chunksize = int(sys.argv[3]) if len(sys.argv) > 3 else CHUNK_ROWS
+    preprocess_data_streaming(sys.argv[1], sys.argv[2], chunksize=chunksize)
+    with open(os.path.join(sys.argv[2], 'manifest.json')) as f:
+        print(f"Partitions written to {sys.argv[2]}: {json.load(f)['rows']}")
@@ -1,5 +1,17 @@
+import asyncio
+import json
+import os
+import tempfile
 import unittest
-from ArtIntMLModel import extract_features  # Assuming main script is named 'main_script.py'
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import average_precision_score, classification_report, roc_auc_score
+from urlmodel.cascade import CascadeModel, calibrate_band
+from scoring_server import MicroBatcher, make_handler
+from urlmodel.domain_index import KnownDomainIndex, update_index
+from urlmodel.evaluate import Evaluation
+from urlmodel.features import extract_features
 
 class TestExtractFeatures(unittest.TestCase):
     def test_valid_url(self):
@@ -20,5 +32,180 @@ class TestExtractFeatures(unittest.TestCase):
         features = extract_features(url)
         self.assertEqual(features, {})  # Verify empty dictionary returned
 
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        # unrounded probabilities of a real model on noisy data
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(6000, 4))
+        y = (X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=1.5, size=6000) > 1).astype(int)
+        model = LogisticRegression().fit(X[:1000], y[:1000])
+        self.y, self.proba = y[1000:], model.predict_proba(X[1000:])
+
+    def test_matches_sklearn_from_one_pass(self):
+        evaluation = Evaluation([0, 1]).update(self.y, self.proba)
+        self.assertEqual(evaluation.classification_report(), classification_report(self.y, self.proba.argmax(axis=1)))
+        # raw scores: only rows sharing a 1/65536 bin are merged, the areas move by far less than 1e-4
+        self.assertAlmostEqual(evaluation.roc_auc(), roc_auc_score(self.y, self.proba[:, 1]), delta=1e-4)
+        self.assertAlmostEqual(evaluation.average_precision(), average_precision_score(self.y, self.proba[:, 1]),
+                               delta=1e-4)
+        # scores on the grid: exact up to the order float sums are taken in
+        grid = np.floor(self.proba * 2 ** 16) / 2 ** 16
+        evaluation = Evaluation([0, 1]).update(self.y, grid)
+        self.assertAlmostEqual(evaluation.roc_auc(), roc_auc_score(self.y, grid[:, 1]), places=12)
+        self.assertAlmostEqual(evaluation.average_precision(), average_precision_score(self.y, grid[:, 1]), places=12)
+        threshold, at = evaluation.choose_threshold(min_precision=0.9)
+        called = self.proba[:, 1] >= threshold
+        self.assertGreaterEqual(at['precision'], 0.9)
+        self.assertEqual(at['recall'], called[self.y == 1].mean())
+
+    def test_streaming_batches_and_saved_results_agree(self):
+        whole = Evaluation([0, 1]).update(self.y, self.proba)
+        streamed = Evaluation([0, 1])
+        for begin in range(0, len(self.y), 1234):
+            streamed.update(self.y[begin:begin + 1234], self.proba[begin:begin + 1234])
+        with tempfile.TemporaryDirectory() as tmp:
+            whole.save(os.path.join(tmp, 'evaluation.json'))
+            saved = Evaluation.load(os.path.join(tmp, 'evaluation.json'))
+        for evaluation in (streamed, saved):
+            self.assertEqual(evaluation.classification_report(), whole.classification_report())
+            self.assertEqual(evaluation.roc_auc(), whole.roc_auc())
+
+    def test_state_stays_bounded(self):
+        rng = np.random.default_rng(1)
+        evaluation = Evaluation([0, 1])
+        for _ in range(10):
+            p = rng.random(100_000)
+            evaluation.update(rng.integers(0, 2, len(p)), np.column_stack([1 - p, p]))
+        self.assertEqual(evaluation.rows, 1_000_000)
+        self.assertLessEqual(len(evaluation.thresholds), 2 ** 16 + 1)
+
+class TestCalibrateBand(unittest.TestCase):
+    def brute_force(self, p, fast_correct, slow_correct, target):
+        # (early exits, accuracy) of the best band over every (low, high) pair
+        values = np.unique(p)
+        best = None
+        for low in np.concatenate(([-1.0], values)):
+            for high in np.concatenate((values, [2.0])):
+                exits = (p <= low) | (p >= high)
+                accuracy = np.where(exits, fast_correct, slow_correct).mean()
+                if low < high and accuracy >= target and (best is None or (exits.sum(), accuracy) > best):
+                    best = (exits.sum(), accuracy)
+        return best
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(1)
+        for trial in range(40):
+            n = rng.integers(5, 80)
+            p = np.round(rng.random(n), 1 + trial % 2)
+            fast_correct = (p > 0.5) == (rng.random(n) < p)
+            slow_correct = rng.random(n) < 0.85
+            target = slow_correct.mean() - rng.choice([-0.05, 0.0, 0.02, 0.1])
+            low, high = calibrate_band(p, fast_correct, slow_correct, target)
+            best = self.brute_force(p, fast_correct, slow_correct, target)
+            if best is None:
+                self.assertEqual((low, high), (-1.0, 2.0))
+                continue
+            exits = (p <= low) | (p >= high)
+            self.assertEqual((exits.sum(), np.where(exits, fast_correct, slow_correct).mean()), best, trial)
+
+class RecordingModel:
+    # stands in for a stage: fixed probabilities, remembers what it scored
+    def __init__(self, positive):
+        self.classes_ = np.array([0, 1])
+        self.positive = np.asarray(positive, dtype=float)
+        self.seen = []
+
+    def predict_proba(self, X):
+        self.seen.append(X.copy())
+        p = self.positive[X.index] if hasattr(X, 'index') else self.positive[:len(X)]
+        return np.column_stack((1 - p, p))
+
+class TestCascadeModel(unittest.TestCase):
+    def test_only_in_band_rows_reach_the_slow_model(self):
+        X = pd.DataFrame({'a': np.arange(6.0), 'b': np.arange(6.0) * 10})
+        fast = RecordingModel([0.1, 0.3, 0.5, 0.7, 0.9, 0.3])
+        slow = RecordingModel([0.0, 1.0, 1.0, 0.0, 1.0, 1.0])
+        model = CascadeModel(fast, slow, 0.3, 0.7)
+        proba = model.predict_proba(X)
+        # the band is open: 0.3 and 0.7 exit early, only row 2 goes on
+        self.assertEqual(len(fast.seen), 1)
+        self.assertEqual(len(slow.seen), 1)
+        pd.testing.assert_frame_equal(slow.seen[0], X.iloc[[2]])
+        np.testing.assert_array_equal(proba[:, 1], [0.1, 0.3, 1.0, 0.7, 0.9, 0.3])
+        np.testing.assert_array_equal(model.predict(X), [0, 0, 1, 1, 1, 0])
+
+    def test_slow_model_is_skipped_when_nothing_is_in_band(self):
+        X = pd.DataFrame({'a': np.arange(3.0)})
+        slow = RecordingModel([0.5, 0.5, 0.5])
+        CascadeModel(RecordingModel([0.0, 0.2, 1.0]), slow, 0.2, 0.8).predict_proba(X)
+        self.assertEqual(slow.seen, [])
+
+    def test_pickles_by_package_path(self):
+        # artifacts unpickle it without the repo root on sys.path
+        self.assertEqual(CascadeModel.__module__, 'urlmodel.cascade')
+
+async def post_score(port, payload):
+    # one request on its own connection, returns (status code, json body)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode()
+    writer.write(f"POST /score HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), json.loads(body)
+
+class TestScoringServer(unittest.TestCase):
+    def serve(self, scenario, index=None, **batcher_args):
+        # runs scenario(port, batcher) against a server whose model calls a url malicious when it has 'login'
+        def score_batch(urls):
+            labels = np.array([int('login' in url) for url in urls])
+            return labels, labels.astype(float)
+
+        async def main():
+            batcher = MicroBatcher(score_batch, **batcher_args)
+            batcher.start()
+            server = await asyncio.start_server(make_handler(batcher, index), '127.0.0.1', 0)
+            try:
+                return await scenario(server.sockets[0].getsockname()[1], batcher)
+            finally:
+                server.close()
+                await batcher.stop()
+        return asyncio.run(main())
+
+    def test_concurrent_requests_share_batches(self):
+        urls = [f"site{i}.com/{'login' if i % 3 == 0 else 'home'}" for i in range(20)]
+
+        async def scenario(port, batcher):
+            responses = await asyncio.gather(*(post_score(port, {'url': url}) for url in urls),
+                                             post_score(port, {'link': 'no url key'}))
+            return responses, batcher.metrics()
+        responses, metrics = self.serve(scenario, max_batch_size=8, max_wait_ms=200)
+        for url, (status, body) in zip(urls, responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(body, {'url': url, 'label': int('login' in url), 'probability': float('login' in url)})
+        self.assertEqual(responses[-1][0], 400)
+        # 20 urls in the 200 ms window, at most 8 to a batch
+        self.assertEqual(metrics['requests'], 20)
+        self.assertEqual(metrics['batch_size_max'], 8)
+        self.assertLess(metrics['batches'], 20)
+
+    def test_non_string_url_is_a_bad_request(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pd.DataFrame([('secure-login.ru/verify', 1)], columns=['url', 'label']).to_csv(
+                os.path.join(tmp, 'labeled.csv'), index=False)
+            update_index(os.path.join(tmp, 'labeled.csv'), os.path.join(tmp, 'index'))
+            index = KnownDomainIndex(os.path.join(tmp, 'index'))
+            self.assertIsNone(index.lookup(5))
+
+            async def scenario(port, batcher):
+                return [await post_score(port, payload) for payload in
+                        ({'url': 5}, {'urls': ['a.com', None]}, {'url': 'secure-login.ru/x'})]
+            bad_number, bad_list, good = self.serve(scenario, index)
+        self.assertEqual(bad_number[0], 400)
+        self.assertIn('string', bad_number[1]['error'])
+        self.assertEqual(bad_list[0], 400)
+        self.assertEqual(good, (200, {'url': 'secure-login.ru/x', 'label': 1, 'probability': 1.0}))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,554 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+import cleandata
+import incremental
+import streaming
+import tuning
+from urlmodel import artifacts, domains, extract_job, feature_cache, hashed_features, parallel_features
+from urlmodel.compiled_forest import CompiledForest
+from urlmodel.domain_index import KnownDomainIndex, update_index
+from urlmodel.features import FEATURE_COLUMNS, extract_features, extract_features_batch, normalize_urls
+
+URLS = [
+    "https://www.youtube.com",
+    "http://skaskt-etender.com/signin/?context=popup&amp;next=https://www.youtube.com/post_login",
+    "",
+    "user:secret@login.example.co.uk:8080/free?click here",
+    "//cdn.example.com/free_stuff",
+    "ftp://[::1]:21/files",
+    "http:not-a-scheme//example.com",
+    "192.168.0.1/login.php",
+    "bücher.例え.jp/ünïcödé",
+    "https://x.com.?a=1#frag@other.com",
+]
+
+class TestExtractFeaturesBatch(unittest.TestCase):
+    def test_matches_single_url_extraction(self):
+        # Every row should equal the dict extract_features builds for that url
+        batch = extract_features_batch(URLS)
+        self.assertEqual(list(batch.columns), FEATURE_COLUMNS)
+        for i, url in enumerate(URLS):
+            self.assertEqual(batch.iloc[i].to_dict(), extract_features(url), url)
+
+    def test_hosts_split_like_the_domain_parser(self):
+        # The suffix walk over whole columns, and the hosts it hands back to domains.extract
+        hosts = ["a.b.city.kawasaki.jp", "x.y.kawasaki.jp", "foo.EXAMPLE.Co.Uk.", "1.2.3.4", "1.2.3", "[::1]:80",
+                 "localhost", ".example.com", "a..com", "...com", "...", "co.uk", "uk", "b-c.x_y.tokyo.jp:443",
+                 "xn--p1ai", "sub.xn--p1ai", "www.github.io", "a.blogspot.com.au", "é.com", "a.ｃｏｍ", " a.com"]
+        urls = [f"{scheme}{host}{path}" for host in hosts for scheme, path in [("", ""), ("https://u@", "/p?q")]]
+        batch = extract_features_batch(urls)
+        for i, url in enumerate(urls):
+            self.assertEqual(batch.iloc[i].to_dict(), extract_features(url), url)
+        # plain ascii hosts never go through the per host parser
+        with mock.patch.object(domains, 'extract', side_effect=AssertionError):
+            extract_features_batch(["https://mail.a.b.co.uk/x", "example.com:80", "a.b.c", "github.io."])
+
+    def test_keeps_series_index(self):
+        # Rows dropped upstream (dropna) should keep lining up with the labels
+        urls = pd.Series(["https://a.com", None, "b.org/login"], index=[3, 7, 9])
+        batch = extract_features_batch(normalize_urls(urls))
+        self.assertEqual(list(batch.index), [3, 7, 9])
+        self.assertEqual(batch.loc[7, 'length'], 0)
+
+class TestExtractFeaturesParallel(unittest.TestCase):
+    def test_matches_batch_extraction(self):
+        # Shards of two rows so every worker writes several slices of the shared array
+        urls = pd.Series(normalize_urls(URLS * 3).tolist(), index=range(100, 100 + 3 * len(URLS)))
+        expected = extract_features_batch(urls)
+        with mock.patch.object(parallel_features, 'MIN_PARALLEL_ROWS', 0):
+            for backend in parallel_features.BACKENDS:
+                result = parallel_features.extract_features_parallel(urls, n_jobs=2, backend=backend, shard_rows=2)
+                pd.testing.assert_frame_equal(result, expected, obj=backend)
+
+def dense_preprocess(filename):
+    # preprocess_data as it was before the compact feature frame: url strings
+    # and int64 features in one frame, scaled and split as whole frames
+    data = pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str}, low_memory=False)
+    data['label'] = pd.to_numeric(data['label'], errors='coerce').fillna(-1)
+    data = pd.concat([data, feature_cache.cached_features(filename).astype(np.int64)], axis=1)
+    numeric_cols = [col for col in FEATURE_COLUMNS if 'hash' not in col]
+    data[numeric_cols] = StandardScaler().fit_transform(data[numeric_cols])
+    return train_test_split(data.drop(['url', 'label'], axis=1), data['label'], test_size=0.2, random_state=42)
+
+def traced_peak(func, *args):
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+class TestFeatureCache(unittest.TestCase):
+    def test_miss_writes_an_entry_and_hits_are_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'urls.csv')
+            pd.DataFrame({'url': URLS, 'label': 0}).to_csv(filename, header=False, index=False)
+            entry_dir = os.path.join(tmp, 'cache', feature_cache.cache_key(filename))
+            extract = mock.patch.object(feature_cache, 'extract_features_parallel',
+                                        wraps=feature_cache.extract_features_parallel)
+            with extract as extractor:
+                missed = feature_cache.cached_features(filename, cache_dir=os.path.join(tmp, 'cache'))
+            self.assertEqual(extractor.call_count, 1)
+            self.assertTrue(os.path.exists(os.path.join(entry_dir, feature_cache.META_FILE)))
+            self.assertEqual(sorted(os.listdir(entry_dir)),
+                             sorted([f"{name}.npy" for name in FEATURE_COLUMNS] + [feature_cache.META_FILE]))
+
+            with extract as extractor:
+                hit = feature_cache.cached_features(filename, cache_dir=os.path.join(tmp, 'cache'))
+            extractor.assert_not_called()
+            for name in FEATURE_COLUMNS:
+                values = hit[name].to_numpy()
+                while values is not None and not isinstance(values, np.memmap):
+                    values = values.base
+                self.assertIsInstance(values, np.memmap, name)
+            pd.testing.assert_frame_equal(hit.copy(), missed)
+            pd.testing.assert_frame_equal(hit.copy(), extract_features_batch(normalize_urls(pd.Series(URLS))))
+
+    def test_key_follows_content_and_feature_version(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'urls.csv')
+            with open(filename, 'w') as f:
+                f.write("a.com,0\n")
+            key = feature_cache.cache_key(filename)
+            os.utime(filename, (0, 0))
+            self.assertEqual(feature_cache.cache_key(filename), key)
+            with open(filename, 'w') as f:
+                f.write("b.com,0\n")
+            changed = feature_cache.cache_key(filename)
+            self.assertNotEqual(changed, key)
+            with mock.patch.object(feature_cache, 'FEATURE_VERSION', feature_cache.FEATURE_VERSION + 1):
+                self.assertNotIn(feature_cache.cache_key(filename), (key, changed))
+
+class TestCompactFeatureFrame(unittest.TestCase):
+    def test_peak_memory_at_least_four_times_lower(self):
+        from urlmodel.extract import preprocess_data
+        from benchmark import generate_dataset
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(feature_cache, 'CACHE_DIR', tmp):
+            filename = os.path.join(tmp, 'urls.csv')
+            generate_dataset(filename, 200_000)
+            feature_cache.cached_features(filename)  # both read the same cache entry
+
+            dense_peak, (_, dense_test, _, _) = traced_peak(dense_preprocess, filename)
+            compact_peak, (X_train, X_test, y_train, y_test) = traced_peak(preprocess_data, filename)
+            self.assertGreaterEqual(dense_peak / compact_peak, 4, (dense_peak, compact_peak))
+            self.assertEqual(list(X_test.index), list(dense_test.index))
+            self.assertEqual(X_train['length'].dtype, np.float32)
+            self.assertEqual(X_train['is_https'].dtype, np.uint8)
+            self.assertEqual(X_train['domain_hash'].dtype, np.int32)
+
+    def test_binary_labels_and_balanced_forest_keep_the_rows(self):
+        from sklearn.ensemble import RandomForestClassifier
+        from urlmodel.extract import preprocess_data
+        from urlmodel.train import train_model
+        rows = [('url', 'label')] + [(f"site{i}.com/{'login' if i % 5 == 0 else 'home'}", int(i % 5 == 0))
+                                     for i in range(200)]
+        rows += [('odd.com', 2), ('bad.com', 'bad'), ('', 1), ('x.com', '')]
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(feature_cache, 'CACHE_DIR', tmp):
+            filename = os.path.join(tmp, 'urls.csv')
+            with open(filename, 'w') as f:
+                f.writelines(f"{url},{label}\n" for url, label in rows)
+            X_train, X_test, y_train, y_test = preprocess_data(filename, 'binary')
+        # the header, the 2, the text label and the rows missing a url or label are dropped
+        self.assertEqual(sorted(X_train.index.tolist() + X_test.index.tolist()), list(range(1, 201)))
+        self.assertEqual(set(y_train) | set(y_test), {0, 1})
+
+        fit = RandomForestClassifier.fit
+        with mock.patch.object(RandomForestClassifier, 'fit', autospec=True, side_effect=fit) as spy:
+            model = train_model(X_train, y_train, 'rf_balanced')
+        (_, X, y), _ = spy.call_args
+        # weighted, not resampled: the forest sees each training row once
+        self.assertEqual(model.class_weight, 'balanced')
+        self.assertIs(X, X_train)
+        self.assertEqual(len(y), len(y_train))
+        np.testing.assert_array_equal(np.bincount(y), np.bincount(y_train))
+
+    def test_encoded_labels_have_no_gaps(self):
+        from urlmodel.feature_frame import read_labels
+        from urlmodel.extract import encode_labels
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'urls.csv')
+            # 'defacement' only appears on a row without a url, which is dropped
+            with open(filename, 'w') as f:
+                f.write("a.com,bad\n,defacement\nb.com,good\nc.com,bad\n,\nd.com,phishing\n")
+            rows, categories = read_labels(filename, dropna=True, chunk_rows=2)
+        np.testing.assert_array_equal(rows, [0, 2, 3, 5])
+        targets, _ = encode_labels(categories, 'encoded')
+        np.testing.assert_array_equal(targets, [0, 1, 0, 2])
+
+class TestBenchmark(unittest.TestCase):
+    def test_keeps_a_workdir_it_did_not_create(self):
+        from benchmark import run_benchmarks
+        with tempfile.TemporaryDirectory() as tmp:
+            keep = os.path.join(tmp, 'keep.txt')
+            open(keep, 'w').close()
+            with contextlib.redirect_stdout(io.StringIO()):
+                report = run_benchmarks(sizes=(50,), variants=(), workdir=tmp)
+            self.assertEqual(os.listdir(tmp), ['keep.txt'])
+        self.assertEqual(report['results'], [])
+
+class TestTuning(unittest.TestCase):
+    def test_rungs_and_saved_winner(self):
+        from sklearn.ensemble import RandomForestClassifier
+        from benchmark import generate_dataset
+
+        def small_forest():
+            return RandomForestClassifier(random_state=42, n_jobs=1), {
+                'n_estimators': [5, 10], 'max_depth': [None, 5], 'min_samples_leaf': [1, 2, 5],
+            }
+
+        searches, halving_search = [], tuning.HalvingRandomSearchCV
+
+        def search(*args, **kwargs):
+            searches.append(halving_search(*args, **kwargs))
+            return searches[-1]
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(feature_cache, 'CACHE_DIR', tmp), \
+                mock.patch.dict(tuning.SEARCHES, {'rf': ('rf', small_forest)}), \
+                mock.patch.object(tuning, 'HalvingRandomSearchCV', side_effect=search):
+            filename = os.path.join(tmp, 'urls.csv')
+            generate_dataset(filename, 3000)
+            report = tuning.tune_model('rf', filename, n_candidates=9, factor=3, n_jobs=1,
+                                       model_dir=os.path.join(tmp, 'model'))
+            artifact = artifacts.load_model(os.path.join(tmp, 'model'))
+            urls = pd.read_csv(filename, nrows=200)['url']
+            X = artifacts.prepare_features(artifact, urls)
+            np.testing.assert_array_equal(artifact.model.predict_proba(X),
+                                          searches[0].best_estimator_.predict_proba(X))
+
+        candidates = [rung['candidates'] for rung in report['rungs']]
+        rows = [rung['rows'] for rung in report['rungs']]
+        self.assertEqual(candidates, [9, 3, 1])
+        self.assertTrue(all(a < b for a, b in zip(rows, rows[1:])), rows)
+        self.assertEqual(report['best_params'], searches[0].best_params_)
+
+class TestCleanData(unittest.TestCase):
+    def test_streaming_keeps_the_rows_drop_duplicates_keeps(self):
+        # with unknown labels both write floats, with good/bad only both write ints
+        for labels, written in ((['good', 'bad', 'unknown'], ',1.0\n'), (['good', 'bad'], ',1\n')):
+            with self.subTest(labels=labels):
+                self.check_same_output(labels, written)
+
+    def check_same_output(self, labels, written):
+        rng = np.random.default_rng(0)
+        data = pd.DataFrame({
+            'url': rng.choice(URLS[:6] + ['example.org/a', 'example.org/b'], 400),
+            'label': rng.choice(labels, 400),
+        })
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            filename = os.path.join(tmp, 'raw.csv')
+            data.to_csv(filename, index=False)
+            cleandata.save_cleaned_data(cleandata.load_and_clean_data(filename), os.path.join(tmp, 'memory.csv'))
+            rows, _ = cleandata.clean_data_streaming(filename, os.path.join(tmp, 'streamed.csv'), chunksize=70,
+                                                     buckets=5, n_jobs=2)
+            with open(os.path.join(tmp, 'memory.csv')) as f:
+                expected = f.read()
+            with open(os.path.join(tmp, 'streamed.csv')) as f:
+                streamed = f.read()
+        self.assertEqual(streamed, expected)
+        self.assertEqual(rows, len(expected.splitlines()) - 1)
+        self.assertIn(written, streamed)
+
+class TestStreaming(unittest.TestCase):
+    def test_partitions_match_compact_split(self):
+        from urlmodel.feature_frame import compact_split
+        urls = pd.Series((URLS * 30)[:290])
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'urls.csv')
+            pd.DataFrame({'url': urls, 'label': np.arange(len(urls)) % 2}).to_csv(filename, header=False, index=False)
+            scaler = streaming.preprocess_data_streaming(filename, os.path.join(tmp, 'out'), chunksize=100)
+            X_train, y_train = streaming.load_split(os.path.join(tmp, 'out'), 'train')
+            X_test, y_test = streaming.load_split(os.path.join(tmp, 'out'), 'test')
+
+        features = extract_features_batch(normalize_urls(urls))
+        compact_train, compact_test, _, _, compact_scaler = compact_split(features, np.arange(len(urls)) % 2)
+        self.assertEqual(sorted(X_train.index.tolist() + X_test.index.tolist()), list(range(len(urls))))
+        np.testing.assert_array_equal(y_train.to_numpy(), X_train.index.to_numpy() % 2)
+        # both scalers are fitted on every row, partial_fit over other chunks only moves the last bits
+        np.testing.assert_allclose(scaler.mean_, compact_scaler.mean_, rtol=1e-12)
+        np.testing.assert_allclose(scaler.scale_, compact_scaler.scale_, rtol=1e-12)
+        # the splits differ (streaming draws rows one by one), every row is scaled the same in both
+        compact = pd.concat([compact_train, compact_test])
+        for X in (X_train, X_test):
+            pd.testing.assert_series_equal(X.dtypes, compact.dtypes)
+            pd.testing.assert_frame_equal(X, compact.loc[X.index], check_index_type=False, rtol=1e-6)
+
+class TestCompiledForest(unittest.TestCase):
+    def test_matches_sklearn_bit_for_bit(self):
+        from sklearn.datasets import make_classification
+        from sklearn.ensemble import RandomForestClassifier
+        X, y = make_classification(n_samples=2000, n_features=9, n_classes=3, n_informative=5, random_state=0)
+        model = RandomForestClassifier(n_estimators=25, random_state=0).fit(X[:1500], y[:1500])
+        compiled = CompiledForest(model)
+        for rows in (X[1500:1501], X[1500:1600], X[1500]):
+            np.testing.assert_array_equal(compiled.predict_proba(rows), model.predict_proba(np.atleast_2d(rows)))
+            np.testing.assert_array_equal(compiled.predict(rows), model.predict(np.atleast_2d(rows)))
+
+class TestHashedFeatures(unittest.TestCase):
+    def test_shape_and_sparsity(self):
+        X = hashed_features.transform_urls(pd.Series(URLS), n_features=2 ** 12)
+        self.assertEqual(X.shape, (len(URLS), 2 ** 12))
+        self.assertEqual(X.format, 'csr')
+        self.assertEqual(X.dtype, np.float32)
+        self.assertTrue(0 < X.nnz < X.shape[0] * X.shape[1] // 10)
+        np.testing.assert_allclose(np.sqrt(X.multiply(X).sum(axis=1)).A1[X.getnnz(axis=1) > 0], 1, rtol=1e-6)
+
+    def test_same_columns_under_any_hash_seed(self):
+        # python's own hash() changes with PYTHONHASHSEED, the features must not
+        code = ("import sys; import pandas as pd; from urlmodel import features, hashed_features; "
+                f"urls = pd.Series({URLS!r}); "
+                "X = hashed_features.transform_urls(urls, n_features=2 ** 12); "
+                "f = features.extract_features_batch(features.normalize_urls(urls)); "
+                "print(X.indices.tolist(), f['domain_hash'].tolist(), f['tld_hash'].tolist())")
+        outputs = [
+            subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)),
+                           env={**os.environ, 'PYTHONHASHSEED': seed}).stdout
+            for seed in ('1', '2')
+        ]
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_trains_on_the_sparse_matrix(self):
+        urls = pd.Series([f"http://login-{i}.bad{i % 7}.xyz/verify?acct={i}" for i in range(200)]
+                         + [f"https://www.site{i}.com/docs/page{i % 11}.html" for i in range(200)])
+        y = pd.Series([1] * 200 + [0] * 200)
+        X = hashed_features.transform_urls(urls, n_features=2 ** 12)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25, random_state=0)
+        model = hashed_features.train_model_hashed(X_train, y_train)
+        self.assertEqual(model.coef_.shape, (1, 2 ** 12))
+        self.assertGreater(model.score(X_test, y_test), 0.95)
+
+class TestArtifacts(unittest.TestCase):
+    def setUp(self):
+        from sklearn.ensemble import RandomForestClassifier
+        features = extract_features_batch(normalize_urls(pd.Series(URLS)))
+        self.scaler = StandardScaler().fit(features[['length', 'num_special_chars', 'num_subdomains']])
+        self.model = RandomForestClassifier(n_estimators=3, random_state=0).fit(features, np.arange(len(URLS)) % 2)
+        self.columns = list(features.columns)
+
+    def test_forest_loads_as_memory_mapped_node_arrays(self):
+        from sklearn.ensemble import RandomForestClassifier
+        with tempfile.TemporaryDirectory() as tmp:
+            artifacts.save_model(tmp, self.model, self.scaler, self.columns)
+            artifact = artifacts.load_model(tmp)
+            self.assertIsInstance(artifact.model, CompiledForest)
+            for name in ('feature', 'threshold', 'children', 'leaf_proba'):
+                self.assertIsInstance(getattr(artifact.model, name), np.memmap)
+            np.testing.assert_array_equal(artifact.model.classes_, self.model.classes_)
+            X = artifacts.prepare_features(artifact, pd.Series(URLS))
+            np.testing.assert_array_equal(artifact.model.predict_proba(X), self.model.predict_proba(X))
+            # small batches never read the pickled forest, big ones hand over to it
+            self.assertIsNone(artifact.model._model)
+            X = artifacts.prepare_features(artifact, pd.Series(URLS * 60))
+            np.testing.assert_array_equal(artifact.model.predict_proba(X), self.model.predict_proba(X))
+            self.assertIsInstance(artifacts.load_model(tmp, mmap_mode=None).model, RandomForestClassifier)
+
+    def test_rejects_artifacts_without_stable_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            artifacts.save_model(tmp, self.model, self.scaler, self.columns)
+            schema_file = os.path.join(tmp, artifacts.SCHEMA_FILE)
+            with open(schema_file) as f:
+                schema = json.load(f)
+            del schema['stable_hash']
+            with open(schema_file, 'w') as f:
+                json.dump(schema, f)
+            with self.assertRaises(ValueError):
+                artifacts.load_model(tmp)
+
+class TestInstrumentation(unittest.TestCase):
+    @unittest.skipUnless(sys.platform == 'linux', "per stage peaks need /proc/self/clear_refs")
+    def test_stage_peaks_include_memory_freed_before_the_end(self):
+        # a fresh process, memory freed by earlier tests would be reused without growing
+        code = ("import json\nimport numpy as np\nfrom urlmodel import instrumentation\ninstrumentation.enable()\n"
+                "with instrumentation.stage('outer'):\n"
+                "    with instrumentation.stage('big'):\n        big = np.ones(8 * 2 ** 20)\n        del big\n"
+                "    with instrumentation.stage('small'):\n        small = np.ones(2 * 2 ** 20)\n"
+                "print(json.dumps([instrumentation.records(), instrumentation.process_peak_mb()]))")
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        (big, small, outer), process_peak = json.loads(out)
+        # 64 MB allocated and freed inside the stage
+        self.assertLess(abs(big['mem_delta_mb']), 4)
+        self.assertGreater(big['peak_mem_delta_mb'], 60)
+        # 16 MB under the peak the first stage left still shows
+        self.assertGreater(small['peak_mem_delta_mb'], 14)
+        self.assertLess(small['peak_mem_delta_mb'], 24)
+        # resets by the inner stages do not hide their peaks from the outer one or the process
+        self.assertGreaterEqual(outer['peak_mem_mb'], big['peak_mem_mb'])
+        self.assertGreaterEqual(process_peak, big['peak_mem_mb'])
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        from sklearn.datasets import make_classification
+        X, y = make_classification(n_samples=600, n_features=6, n_classes=3, n_informative=4, random_state=0)
+        self.X = pd.DataFrame(X, columns=[f"f{i}" for i in range(6)])
+        self.y = y
+        # the delta only has class 0 rows, the model has to keep all three classes
+        self.X_new, self.y_new = self.X[400:][y[400:] == 0].reset_index(drop=True), y[400:][y[400:] == 0]
+
+    def test_missing_classes_get_zero_weight_rows(self):
+        X, y, weights = incremental._with_all_classes(self.X_new, self.y_new, np.array([0, 1, 2]))
+        self.assertEqual(len(X), len(self.X_new) + 2)
+        np.testing.assert_array_equal(y[-2:], [1, 2])
+        np.testing.assert_array_equal(weights, [1] * len(self.X_new) + [0, 0])
+        with self.assertRaises(ValueError):
+            incremental._with_all_classes(self.X_new, np.full(len(self.y_new), 7), np.array([0, 1, 2]))
+
+    def test_update_forest_appends_trees(self):
+        from sklearn.ensemble import RandomForestClassifier
+        model = RandomForestClassifier(n_estimators=20, random_state=0).fit(self.X[:400], self.y[:400])
+        old = list(model.estimators_)
+        incremental.update_forest(model, self.X_new, self.y_new, new_trees=5, max_trees=25)
+        self.assertEqual(len(model.estimators_), 25)
+        self.assertEqual(model.n_estimators, 25)
+        self.assertTrue(all(a is b for a, b in zip(model.estimators_[:20], old)))
+        np.testing.assert_array_equal(model.classes_, [0, 1, 2])
+        # by default the forest keeps its size and retires the oldest trees
+        incremental.update_forest(model, self.X_new, self.y_new, new_trees=5)
+        self.assertEqual(len(model.estimators_), 25)
+        self.assertTrue(all(a is b for a, b in zip(model.estimators_[:15], old[5:])))
+
+    def test_update_booster_appends_rounds(self):
+        try:
+            from xgboost import XGBClassifier
+        except ImportError:
+            self.skipTest("xgboost is not installed")
+        model = XGBClassifier(n_estimators=10, max_depth=3).fit(self.X[:400], self.y[:400])
+        updated = incremental.update_booster(model, self.X_new, self.y_new, rounds=4)
+        self.assertEqual(updated.get_booster().num_boosted_rounds(), 14)
+        old_trees, new_trees = model.get_booster().get_dump(), updated.get_booster().get_dump()
+        self.assertEqual(new_trees[:len(old_trees)], old_trees)
+        self.assertEqual(updated.predict_proba(self.X[:5]).shape, (5, 3))
+
+class TestExtractJob(unittest.TestCase):
+    def write_csv(self, path):
+        urls = [f"{url}/{i}" if url else url for i in range(30) for url in URLS]
+        pd.DataFrame({'url': urls, 'label': 0}).to_csv(path, header=False, index=False)
+        return normalize_urls(pd.read_csv(path, header=None, usecols=[0], names=['url'], dtype={'url': str})['url'])
+
+    def test_resumes_and_matches_whole_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename, job_dir = os.path.join(tmp, 'urls.csv'), os.path.join(tmp, 'job')
+            urls = self.write_csv(filename)
+            shards = extract_job.shard_ranges(filename, shard_bytes=1000)
+            self.assertEqual(shards[0][0], 0)
+            self.assertEqual(shards[-1][1], os.path.getsize(filename))
+            self.assertGreater(len(shards), 5)
+
+            # a first run that died after its first shard, another worker holds a fresh claim on the second
+            plan = extract_job.plan_job(filename, job_dir, feature_cache.file_digest(filename), shard_bytes=1000)
+            self.assertTrue(extract_job._try_claim(job_dir, 0, extract_job.LEASE_SECONDS))
+            extract_job._write_shard(job_dir, 0, extract_job.extract_shard(filename, *plan['shards'][0]))
+            self.assertTrue(extract_job._try_claim(job_dir, 1, extract_job.LEASE_SECONDS))
+            kwargs = dict(n_jobs=1, job_dir=job_dir, cache_dir=tmp, shard_bytes=1000)
+            self.assertIsNone(extract_job.run_job(filename, wait=False, **kwargs))
+            self.assertEqual(extract_job.job_status(job_dir), {'shards': len(shards), 'done': len(shards) - 1,
+                                                               'running': 1, 'pending': 0})
+
+            # once its lease runs out the claim is taken over and the job finishes
+            old = os.path.getmtime(extract_job._claim_path(job_dir, 1)) - 2 * extract_job.LEASE_SECONDS
+            os.utime(extract_job._claim_path(job_dir, 1), (old, old))
+            with mock.patch.object(extract_job, 'extract_shard', wraps=extract_job.extract_shard) as extract:
+                features = extract_job.run_job(filename, **kwargs)
+            self.assertEqual(extract.call_count, 1)
+            pd.testing.assert_frame_equal(features.copy(), extract_features_batch(urls))
+            self.assertFalse(os.path.exists(job_dir))
+            pd.testing.assert_frame_equal(feature_cache.cached_features(filename, cache_dir=tmp).copy(), features.copy())
+
+    def test_shared_job_dir_keeps_files_the_job_did_not_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename, job_dir = os.path.join(tmp, 'urls.csv'), os.path.join(tmp, 'shared')
+            urls = self.write_csv(filename)
+            os.makedirs(job_dir)
+            with open(os.path.join(job_dir, 'other_team_data.txt'), 'w') as f:
+                f.write('keep me')
+            features = extract_job.run_job(filename, n_jobs=1, job_dir=job_dir, cache_dir=tmp, shard_bytes=1000)
+            pd.testing.assert_frame_equal(features.copy(), extract_features_batch(urls))
+            self.assertEqual(os.listdir(job_dir), ['other_team_data.txt'])
+
+    def test_second_merger_loads_the_entry_the_first_wrote(self):
+        merge_job = extract_job.merge_job
+
+        def merged_elsewhere_first(filename, job_dir, entry_dir):
+            # another machine merges the finished job just before this one does
+            merge_job(filename, job_dir, entry_dir)
+            merge_job(filename, job_dir, entry_dir)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'urls.csv')
+            urls = self.write_csv(filename)
+            with mock.patch.object(extract_job, 'merge_job', side_effect=merged_elsewhere_first) as merge:
+                features = extract_job.run_job(filename, n_jobs=1, job_dir=os.path.join(tmp, 'job'), cache_dir=tmp,
+                                               shard_bytes=1000)
+            self.assertEqual(merge.call_count, 1)
+            pd.testing.assert_frame_equal(features.copy(), extract_features_batch(urls))
+
+class TestKnownDomainIndex(unittest.TestCase):
+    def write_csv(self, path, rows):
+        pd.DataFrame(rows, columns=['url', 'label']).to_csv(path, index=False)
+
+    def test_lookup_and_incremental_update(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            index_dir = os.path.join(tmp, 'index')
+            self.write_csv(os.path.join(tmp, 'day1.csv'), [
+                ('https://www.github.com/a', 0), ('secure-login.ru/verify', 1), ('mail.bbc.co.uk/news', 0),
+            ])
+            update_index(os.path.join(tmp, 'day1.csv'), index_dir)
+            index = KnownDomainIndex(index_dir)
+            self.assertEqual(index.lookup('https://github.com/a'), 0)  # same url once normalized
+            self.assertEqual(index.lookup('http://secure-login.ru/other'), 1)  # same registered domain
+            self.assertEqual(index.lookup('news.bbc.co.uk'), 0)
+            self.assertIsNone(index.lookup('unknown.example.org'))
+            self.assertEqual(list(index.lookup_batch(['github.com/x', 'nowhere.test', None])), [0, -1, -1])
+            self.assertEqual(index.stats()['index_hit_rate'], 4 / 7)
+
+            # a malicious url on github makes the domain ambiguous, the url itself is known
+            self.write_csv(os.path.join(tmp, 'day2.csv'), [('github.com/evil', 1)])
+            update_index(os.path.join(tmp, 'day2.csv'), index_dir)
+            index = KnownDomainIndex(index_dir)
+            self.assertIsNone(index.lookup('github.com/x'))
+            self.assertEqual(index.lookup('github.com/evil'), 1)
+            self.assertEqual(index.lookup('https://github.com/a'), 0)
+            self.assertEqual(len(index.meta['sources']), 2)
+
+class TestLazyImports(unittest.TestCase):
+    def test_scoring_import_stays_light(self):
+        # short lived scoring workers should not pay for the data and model stack before they score
+        code = ("import sys, urlmodel.score; "
+                "print(sorted(m for m in ('numpy', 'pandas', 'sklearn', 'matplotlib', 'xgboost') if m in sys.modules))")
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(out.strip(), '[]')
+
+class TestDomains(unittest.TestCase):
+    def test_matches_tldextract_snapshot(self):
+        # Same split tldextract gives when it only uses its bundled suffix list
+        try:
+            import tldextract
+        except ImportError:
+            self.skipTest("tldextract is not installed")
+        reference = tldextract.TLDExtract(suffix_list_urls=())
+        for url in URLS + ["a.b.city.kawasaki.jp", "x.y.kawasaki.jp", "foo.EXAMPLE.Co.Uk.", "1.2.3.4", "[::1]", "localhost"]:
+            expected = reference(url)
+            self.assertEqual(domains.extract(url), (expected.subdomain, expected.domain, expected.suffix), url)
+
+    def test_repeated_hosts_hit_the_cache(self):
+        domains.clear_cache()
+        for _ in range(3):
+            domains.extract("https://login.example.com/path")
+        stats = domains.cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#Hyperparameter search for the random forest and xgboost trainers. Features
+#are extracted once (and come from the feature cache on later runs), then
+#successive halving tries many configurations on a small sample of the
+#training rows and only gives the better ones more rows. Trials run in
+#parallel on all cores, each model itself is single threaded
+
+import argparse
+import sys
+import time
+
+import numpy as np #for data analysis
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401, makes the import below available
+from sklearn.model_selection import HalvingRandomSearchCV
+from sklearn.metrics import accuracy_score
+
+from urlmodel.artifacts import save_model
+from urlmodel.extract import preprocess_data
+from urlmodel.instrumentation import stage
+from urlmodel.train import MODELS
+
+N_CANDIDATES = 32
+FACTOR = 3  # each rung keeps 1/FACTOR of the candidates and gives them FACTOR times the rows
+MIN_ROWS = 100  # smallest training sample a candidate is scored on
+
+def _random_forest():
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(random_state=42, n_jobs=1), {
+        'n_estimators': [50, 100, 200, 400],
+        'max_depth': [None, 10, 20, 40],
+        'min_samples_leaf': [1, 2, 5],
+        'max_features': ['sqrt', 'log2', None],
+    }
+
+def _xgboost():
+    from xgboost import XGBClassifier
+    return XGBClassifier(random_state=42, n_jobs=1), {
+        'n_estimators': [100, 200, 400],
+        'max_depth': [3, 6, 9],
+        'learning_rate': [0.03, 0.1, 0.3],
+        'subsample': [0.7, 1.0],
+        'colsample_bytree': [0.7, 1.0],
+    }
+
+#variant: (urlmodel.train model whose labels the features are prepared with, model and search space)
+SEARCHES = {
+    'rf': ('rf', _random_forest),
+    'xgb': ('xgb', _xgboost),
+}
+
+def tune_model(variant, filename, n_candidates=N_CANDIDATES, factor=FACTOR, n_jobs=-1, model_dir=None):
+    kind, make_search = SEARCHES[variant]
+    X_train, X_test, y_train, y_test, scaler = preprocess_data(filename, MODELS[kind], return_scaler=True)
+
+    estimator, space = make_search()
+    # first rung sized so the last few candidates get (nearly) every training row
+    last_rung = int(np.floor(np.log(n_candidates) / np.log(factor)))
+    min_rows = max(len(X_train) // factor ** last_rung, MIN_ROWS)
+    search = HalvingRandomSearchCV(
+        estimator, space, n_candidates=n_candidates, factor=factor, resource='n_samples', min_resources=min_rows,
+        scoring='accuracy', cv=3, n_jobs=n_jobs, random_state=42, refit=True,
+    )
+    started = time.perf_counter()
+    with stage('tune', rows=len(X_train)):
+        search.fit(X_train, y_train)
+    elapsed = time.perf_counter() - started
+
+    results = search.cv_results_
+    rungs = [
+        {'iteration': i, 'candidates': int(search.n_candidates_[i]), 'rows': int(search.n_resources_[i]),
+         'best_score': float(np.nanmax(results['mean_test_score'][results['iter'] == i]))}
+        for i in range(search.n_iterations_)
+    ]
+    with stage('evaluate', rows=len(X_test)):
+        accuracy = accuracy_score(y_test, search.best_estimator_.predict(X_test))
+    if model_dir:
+        save_model(model_dir, search.best_estimator_, scaler, list(X_train.columns))
+    return {
+        'variant': variant,
+        'best_params': search.best_params_,
+        'best_cv_score': float(search.best_score_),
+        'test_accuracy': float(accuracy),
+        # search plus the refit of the winner on all the training rows
+        'seconds_to_best': elapsed,
+        'refit_seconds': float(search.refit_time_),
+        'rungs': rungs,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune a model with successive halving and save the winner")
+    parser.add_argument('variant', choices=list(SEARCHES))
+    parser.add_argument('filename', nargs='?', default='cleaned_data.csv')
+    parser.add_argument('--candidates', type=int, default=N_CANDIDATES)
+    parser.add_argument('--factor', type=int, default=FACTOR)
+    parser.add_argument('--jobs', type=int, default=-1)
+    parser.add_argument('--output', help="artifact directory, model_artifact_tuned_<variant> by default")
+    args = parser.parse_args()
+
+    model_dir = args.output or f"model_artifact_tuned_{args.variant}"
+    try:
+        report = tune_model(args.variant, args.filename, args.candidates, args.factor, args.jobs, model_dir)
+    except FileNotFoundError:
+        print(f"The file {args.filename} was not found.")
+        sys.exit(1)
+    for rung in report['rungs']:
+        print(f"iteration {rung['iteration']}: {rung['candidates']:3d} candidates on {rung['rows']:8d} rows,"
+              f" best cv accuracy {rung['best_score']:.4f}")
+    print(f"Best parameters: {report['best_params']}")
+    print(f"Cross validated accuracy: {report['best_cv_score']:.4f}  test accuracy: {report['test_accuracy']:.4f}")
+    print(f"Time to best configuration: {report['seconds_to_best']:.1f}s (refit {report['refit_seconds']:.1f}s)")
+    print(f"Model written to {model_dir}")
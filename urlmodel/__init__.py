@@ -0,0 +1,14 @@
+#The url classifier pipeline as one package. Each step is its own module so
+#a caller only pays for the imports of the step it runs:
+#  urlmodel.extract  labeled csv -> train and test feature frames
+#  urlmodel.train    fit and evaluate a random forest or xgboost model
+#  urlmodel.evaluate reports, curves and thresholds from one scoring pass
+#  urlmodel.score    score urls with a saved model artifact
+#  urlmodel.plot     matplotlib charts of a trained model
+#and the library they share: features and domains (lexical url features),
+#feature_cache, parallel_features and extract_job (extracting them once per
+#file), feature_frame, hashed_features, artifacts, compiled_forest,
+#domain_index, instrumentation and cascade (the two stage model cascade.py
+#trains and pickles)
+#Nothing is imported here, `import urlmodel.score` stays a few milliseconds
+#and pandas, sklearn and the model are loaded on the first url scored
@@ -0,0 +1,94 @@
+#Saves a trained model together with its fitted scaler and feature schema so
+#scoring runs can load it instead of retraining. The schema records the
+#hashing the features were built with, a model trained on hash values of
+#another function or seed would load fine and score garbage, so load_model
+#refuses artifacts that do not carry the marker or carry a different one.
+#Random forests are also saved as the flat node arrays of compiled_forest,
+#which load memory mapped so scoring workers share one copy of the trees
+
+import json
+import os
+from collections import namedtuple
+
+import joblib
+
+from urlmodel.features import FEATURE_COLUMNS, HASH_SEED, SCALED_COLUMNS, extract_features_batch, normalize_urls
+
+ARTIFACT_VERSION = 2
+MODEL_FILE = 'model.joblib'
+SCALER_FILE = 'scaler.joblib'
+SCHEMA_FILE = 'schema.json'
+FOREST_DIR = 'forest'  # compiled node arrays of a random forest
+
+DENSE_ENGINE = {'name': 'dense'}
+#the seeded, process independent hash behind domain_hash, tld_hash and the hashed engine
+STABLE_HASH = {'function': 'murmurhash3_32', 'seed': HASH_SEED}
+
+ModelArtifact = namedtuple(
+    'ModelArtifact', ['model', 'scaler', 'feature_columns', 'scaled_columns', 'feature_engine']
+)
+
+def save_model(path, model, scaler, feature_columns=FEATURE_COLUMNS, scaled_columns=None, feature_engine=None):
+    # feature_engine says how urls become features, the dense lexical columns
+    # by default or e.g. {'name': 'hashed', 'n_features': ..., 'seed': ...}
+    feature_engine = feature_engine or DENSE_ENGINE
+    if feature_engine['name'] != 'dense':
+        feature_columns, scaled_columns = [], []
+    elif scaled_columns is None:
+        scaled_columns = [col for col in feature_columns if col in SCALED_COLUMNS]
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(model, os.path.join(path, MODEL_FILE))
+    joblib.dump(scaler, os.path.join(path, SCALER_FILE))
+    compiled = None
+    from sklearn.ensemble import RandomForestClassifier
+    if isinstance(model, RandomForestClassifier):
+        from urlmodel.compiled_forest import CompiledForest
+        CompiledForest(model).save(os.path.join(path, FOREST_DIR))
+        compiled = FOREST_DIR
+    schema = {
+        'version': ARTIFACT_VERSION,
+        'model_class': f"{type(model).__module__}.{type(model).__name__}",
+        'feature_columns': list(feature_columns),
+        'scaled_columns': list(scaled_columns),
+        'feature_engine': feature_engine,
+        'stable_hash': STABLE_HASH,
+        'compiled_forest': compiled,
+    }
+    with open(os.path.join(path, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+
+def load_model(path, mmap_mode='r'):
+    #mmap_mode='r' maps the saved arrays read only, worker processes loading
+    #the same artifact share those pages through the os page cache. A random
+    #forest comes back as a CompiledForest over its mapped node arrays, the
+    #pickled forest is only read for big batches. Xgboost boosters are copied
+    #while unpickling whatever the mode. mmap_mode=None loads the sklearn
+    #forest itself, e.g. to keep training it
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    if schema['version'] != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported model artifact version {schema['version']} in {path}")
+    if schema.get('stable_hash') != STABLE_HASH:
+        raise ValueError(f"{path} was not trained on {STABLE_HASH['function']} with seed {STABLE_HASH['seed']}"
+                         ", its hashed features would not match, retrain it")
+    model_file = os.path.join(path, MODEL_FILE)
+    if mmap_mode is not None and schema.get('compiled_forest'):
+        from urlmodel.compiled_forest import CompiledForest
+        model = CompiledForest.load(os.path.join(path, schema['compiled_forest']), mmap_mode,
+                                    load_model=lambda: joblib.load(model_file))
+    else:
+        model = joblib.load(model_file, mmap_mode=mmap_mode)
+    scaler = joblib.load(os.path.join(path, SCALER_FILE), mmap_mode=mmap_mode)
+    return ModelArtifact(
+        model, scaler, schema['feature_columns'], schema['scaled_columns'], schema.get('feature_engine', DENSE_ENGINE)
+    )
+
+def prepare_features(artifact, urls): #raw urls to the features the model was trained on
+    engine = artifact.feature_engine
+    if engine['name'] == 'hashed':
+        from urlmodel.hashed_features import transform_urls
+        return transform_urls(urls, engine['n_features'], engine['seed'])
+    features = extract_features_batch(normalize_urls(urls))
+    if len(features):
+        features[artifact.scaled_columns] = artifact.scaler.transform(features[artifact.scaled_columns])
+    return features[artifact.feature_columns]
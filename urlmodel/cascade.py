@@ -0,0 +1,82 @@
+#The two stage model the cascade script trains, kept in the package so
+#artifacts that pickle it load wherever urlmodel imports: a small random
+#forest answers the urls it is sure about, the ones whose malicious
+#probability falls inside the band go on to the slow model. calibrate_band
+#picks that band on validation rows
+
+import bisect
+
+import numpy as np #for data analysis
+
+class CascadeModel:
+    # Looks like a classifier to predict.py and the scoring server: classes_,
+    # predict_proba and predict over the same feature frame both stages use
+    def __init__(self, fast, slow, low, high):
+        self.fast = fast
+        self.slow = slow
+        self.low = low
+        self.high = high
+        self.classes_ = np.asarray(fast.classes_)
+        self._positive = list(self.classes_).index(1)
+
+    def uncertain(self, fast_proba): #rows the first stage hands on to the second
+        p = fast_proba[:, self._positive]
+        return (p > self.low) & (p < self.high)
+
+    def predict_proba(self, X):
+        proba = self.fast.predict_proba(X)
+        band = np.flatnonzero(self.uncertain(proba))
+        if len(band):
+            proba[band] = self.slow.predict_proba(X.iloc[band] if hasattr(X, 'iloc') else X[band])
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+def calibrate_band(fast_proba, fast_correct, slow_correct, target_accuracy):
+    # Every (low, high) pair of first stage probabilities is tried: rows at or
+    # below low or at or above high exit early and keep the first stage
+    # answer. Returns the pair with the most early exits whose validation
+    # accuracy still reaches the target, the more accurate one on a tie.
+    # Memory stays linear in the number of distinct probabilities
+    values = np.unique(fast_proba)
+    gain = fast_correct.astype(np.int64) - slow_correct  # accuracy change when a row exits early
+    order = np.argsort(fast_proba, kind='stable')
+    p, gain = fast_proba[order], gain[order]
+    below = np.searchsorted(p, values, side='right')  # rows with p <= value
+    above = len(p) - np.searchsorted(p, values, side='left')  # rows with p >= value
+    gain_prefix = np.concatenate(([0], np.cumsum(gain)))
+
+    # low i and high j over the same U + 1 slots: low 0 is -1 (nothing exits
+    # as benign), high U is 2 (nothing exits as malicious), low i < high j
+    # exactly when i <= j
+    lows = np.concatenate(([-1.0], values))
+    highs = np.concatenate((values, [2.0]))
+    exits_low = np.concatenate(([0], below)).tolist()
+    exits_high = np.concatenate((above, [0])).tolist()
+    gain_low = np.concatenate(([0], gain_prefix[below])).tolist()
+    gain_high = np.concatenate((gain_prefix[-1] - gain_prefix[len(p) - above], [0])).tolist()
+    required = target_accuracy * len(p) - int(slow_correct.sum())  # gain a pair needs
+
+    # exits_high falls as j grows, so the best high for low i is the first
+    # j >= i with enough gain. Walking i downwards, a stack keeps the j >= i
+    # not beaten by a smaller j with at least as much gain: smallest j on
+    # top, gains rising from top to bottom, searched by bisection
+    stack, stack_gain = [], []  # bottom first, stack_gain holds the negated gains so it is ascending
+    best, best_key = None, None
+    for i in range(len(lows) - 1, -1, -1):
+        while stack and -stack_gain[-1] <= gain_high[i]:
+            stack.pop()
+            stack_gain.pop()
+        stack.append(i)
+        stack_gain.append(-gain_high[i])
+        k = bisect.bisect_right(stack_gain, -(required - gain_low[i])) - 1
+        if k < 0:
+            continue
+        j = stack[k]
+        key = (exits_low[i] + exits_high[j], gain_low[i] + gain_high[j])
+        if best_key is None or key > best_key:
+            best, best_key = (i, j), key
+    if best is None:  # not even the slow model alone reaches the target
+        return -1.0, 2.0
+    return float(lows[best[0]]), float(highs[best[1]])
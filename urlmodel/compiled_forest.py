@@ -0,0 +1,165 @@
+#Compiles a fitted RandomForestClassifier into flat numpy node arrays so
+#scoring is one vectorized walk down every tree at once instead of sklearn's
+#input validation and a python call per tree. Probabilities are the same
+#bits sklearn gives: inputs are compared as float32 against the float64
+#thresholds, leaves hold the normalized class fractions each tree returns and
+#the trees are summed in order before dividing by their number
+#
+#Artifacts keep the node arrays as .npy files next to the pickled forest.
+#Loaded with mmap_mode='r' every scoring process maps the same file pages, the
+#pickled forest is only read when a batch is big enough to hand to sklearn
+
+import json
+import os
+import sys
+import time
+
+import numpy as np #for data analysis
+from sklearn.ensemble import RandomForestClassifier
+
+TREE_LEAF = -1  # sklearn marks leaves with this child index
+#past this many rows sklearn's cython loop over the trees beats the numpy walk,
+#bigger batches are handed to the forest itself (same bits either way)
+MAX_COMPILED_ROWS = 512
+#what save() writes, every node array plus the class labels
+ARRAYS = ('classes_', 'roots', 'feature', 'threshold', 'missing_left', 'children', 'leaf_proba', 'is_leaf')
+META_FILE = 'forest.json'
+
+class CompiledForest:
+    def __init__(self, model):
+        self._model = model
+        self._load_model = None
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        n_classes = int(model.n_classes_)
+
+        self.classes_ = np.asarray(model.classes_)
+        self.n_classes_ = n_classes
+        self.feature_names_in_ = getattr(model, 'feature_names_in_', None)
+        self.feature_names = None if self.feature_names_in_ is None else list(self.feature_names_in_)
+        self.n_features_in_ = model.n_features_in_
+        self.roots = offsets[:-1].astype(np.intp)
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.intp)
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        self.missing_left = np.concatenate([
+            getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8)) for tree in trees
+        ]).astype(bool)
+
+        # children[node] = (left, right) as global node numbers, leaves point at themselves
+        children = np.empty((offsets[-1], 2), dtype=np.intp)
+        leaf_proba = np.empty((offsets[-1], n_classes))
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == TREE_LEAF
+            children[offset + nodes, 0] = np.where(leaf, nodes, tree.children_left) + offset
+            children[offset + nodes, 1] = np.where(leaf, nodes, tree.children_right) + offset
+            # DecisionTreeClassifier.predict_proba: leaf values over their sum, 0 sums left as they are
+            value = tree.value[:, 0, :n_classes]
+            normalizer = value.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_proba[offset:offset + tree.node_count] = value / normalizer[:, None]
+        self.is_leaf = children[:, 0] == np.arange(len(children))
+        self.children = children
+        self.leaf_proba = leaf_proba
+        self.n_trees = len(trees)
+
+    @property
+    def model(self): #the sklearn forest, read from the artifact on first use when loaded from disk
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+
+    def save(self, path):
+        # every file is written aside and renamed over the old one, processes
+        # that still map the old arrays keep reading them
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            # class labels read from pandas can be an object array, np.load maps plain dtypes only
+            values = np.asarray(self.classes_.tolist()) if name == 'classes_' else getattr(self, name)
+            staging = os.path.join(path, f".staging-{name}.npy")
+            np.save(staging, values, allow_pickle=False)
+            os.replace(staging, os.path.join(path, f"{name}.npy"))
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({'n_features_in': int(self.n_features_in_), 'feature_names': self.feature_names,
+                       'n_trees': self.n_trees}, f, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', load_model=None):
+        # load_model: returns the sklearn forest the arrays were compiled from,
+        # for batches past MAX_COMPILED_ROWS
+        forest = cls.__new__(cls)
+        forest._model, forest._load_model = None, load_model
+        for name in ARRAYS:
+            setattr(forest, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        forest.n_classes_ = len(forest.classes_)
+        forest.n_features_in_ = meta['n_features_in']
+        forest.feature_names = meta['feature_names']
+        names = forest.feature_names
+        forest.feature_names_in_ = None if names is None else np.asarray(names, dtype=object)
+        forest.n_trees = meta['n_trees']
+        return forest
+
+    def _as_array(self, X):
+        if hasattr(X, 'columns') and self.feature_names_in_ is not None and list(X.columns) != self.feature_names:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def apply(self, X): #leaf reached in every tree, (rows, trees) of global node numbers
+        X = self._as_array(X)
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        nodes = np.tile(self.roots, n_rows)
+        base = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+        # one step down per level for the (row, tree) pairs not yet at a leaf
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        while len(active):
+            at = nodes[active]
+            value = values[base[active] + self.feature[at]]
+            go_right = ~((value <= self.threshold[at]) | (np.isnan(value) & self.missing_left[at]))
+            at = self.children[at, go_right.view(np.uint8)]
+            nodes[active] = at
+            active = active[~self.is_leaf[at]]
+        return nodes.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        if len(X) > MAX_COMPILED_ROWS and getattr(X, 'ndim', 2) == 2 and (
+                self._model is not None or self._load_model is not None):
+            return self.model.predict_proba(X)
+        # summed over the tree axis, which numpy adds up one tree after the
+        # other like sklearn's accumulation does
+        proba = np.asarray(self.leaf_proba[self.apply(X).T].sum(axis=0))
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+def compile_artifact(artifact): #swaps a random forest in a ModelArtifact for its compiled form
+    if isinstance(artifact.model, RandomForestClassifier):
+        return artifact._replace(model=CompiledForest(artifact.model))
+    return artifact
+
+if __name__ == "__main__":
+    from urlmodel.artifacts import load_model, prepare_features
+
+    if len(sys.argv) < 2:
+        print("Usage: python -m urlmodel.compiled_forest <model_dir> [url ...]  (compares compiled and sklearn scoring)")
+        sys.exit(1)
+
+    artifact = load_model(sys.argv[1], mmap_mode=None)
+    if not isinstance(artifact.model, RandomForestClassifier):
+        print(f"{sys.argv[1]} holds a {type(artifact.model).__name__}, only random forests can be compiled")
+        sys.exit(1)
+    compiled = CompiledForest(artifact.model)
+    urls = sys.argv[2:] or ['https://www.youtube.com', 'http://secure-login.ru/verify/account?id=1']
+    X = prepare_features(artifact, urls)
+    print(f"Bit for bit equal: {np.array_equal(compiled.predict_proba(X), artifact.model.predict_proba(X))}")
+    for name, model in (('sklearn', artifact.model), ('compiled', compiled)):
+        row = X.iloc[:1]
+        started = time.perf_counter()
+        for _ in range(200):
+            model.predict_proba(row)
+        print(f"{name:9s} {(time.perf_counter() - started) / 200 * 1e6:9.1f} us per single url")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#Lookup index of urls and registered domains whose label is already known
+#from the labeled dataset, so scoring can answer them without running the
+#feature extraction and the model. Keys are 64 bit murmurhash pairs of the
+#normalized url ('u:') or registered domain ('d:') stored sorted with their
+#benign/malicious counts. A key only answers when every labeled row agrees,
+#a domain with both labels (a compromised site) is left to the model. A
+#memory mapped Bloom filter over the answering keys rejects most misses
+#before the sorted table is touched. Updates merge the counts of a new
+#labeled file into the existing table, nothing is re-read
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from sklearn.utils import murmurhash3_32
+
+from urlmodel import domains
+from urlmodel.feature_cache import file_digest
+from urlmodel.features import normalize_urls
+
+INDEX_DIR = 'known_domains'
+KEYS_FILE = 'keys.npy'
+COUNTS_FILE = 'counts.npy'
+BLOOM_FILE = 'bloom.npy'
+META_FILE = 'meta.json'
+CHUNK_ROWS = 500_000
+FALSE_POSITIVE_RATE = 0.01  # Bloom filter, a false positive only costs one searchsorted
+HASH_SEEDS = (1, 2)
+
+def key_hash(key): #64 bit hash from two seeded 32 bit murmurhashes
+    high, low = (murmurhash3_32(key, seed=seed, positive=True) for seed in HASH_SEEDS)
+    return (high << 32) | low
+
+def registered_domain(url):
+    ext = domains.extract(url)
+    return f"{ext.domain}.{ext.suffix}" if ext.suffix else ext.domain
+
+def url_keys(urls):
+    # (url hashes, domain hashes) of already normalized urls, the domain parse
+    # only runs once per distinct host
+    hosts = [domains.hostname(url) for url in urls]
+    codes, uniques = pd.factorize(np.asarray(hosts, dtype=object))
+    host_keys = np.array([key_hash('d:' + registered_domain(host)) for host in uniques], dtype=np.uint64)
+    url_hashes = np.fromiter((key_hash('u:' + url) for url in urls), dtype=np.uint64, count=len(urls))
+    return url_hashes, host_keys[codes] if len(codes) else np.empty(0, dtype=np.uint64)
+
+def _bloom_shape(n_keys):
+    n_bits = max(64, math.ceil(-n_keys * math.log(FALSE_POSITIVE_RATE) / math.log(2) ** 2))
+    n_hashes = max(1, round(n_bits / max(n_keys, 1) * math.log(2)))
+    return (n_bits + 7) // 8 * 8, n_hashes
+
+def _bloom_positions(keys, n_bits, n_hashes):
+    # double hashing: the i-th bit is high + i * low, both halves of the 64 bit key
+    keys = np.asarray(keys, dtype=np.uint64)
+    high, low = keys >> np.uint64(32), keys & np.uint64(0xFFFFFFFF)
+    steps = np.arange(n_hashes, dtype=np.uint64)
+    return (high[:, None] + steps * (low[:, None] | np.uint64(1))) % np.uint64(n_bits)
+
+def _build_bloom(keys):
+    n_bits, n_hashes = _bloom_shape(len(keys))
+    bits = np.zeros(n_bits, dtype=bool)
+    bits[_bloom_positions(keys, n_bits, n_hashes).ravel()] = True
+    return np.packbits(bits), n_hashes
+
+def _read_counts(filename, chunk_rows=CHUNK_ROWS):
+    # labeled csv in the cleaned_data.csv layout to sorted unique keys and their (benign, malicious) counts
+    keys, labels = [], []
+    for chunk in pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str},
+                             chunksize=chunk_rows, low_memory=False):
+        label = pd.to_numeric(chunk['label'], errors='coerce')
+        chunk = chunk[label.isin([0, 1]) & chunk['url'].notna()]
+        url_hashes, domain_hashes = url_keys(normalize_urls(chunk['url']).tolist())
+        label = label[chunk.index].to_numpy(dtype=np.int64)
+        keys += [url_hashes, domain_hashes]
+        labels += [label, label]
+    if not keys:
+        return np.empty(0, dtype=np.uint64), np.empty((0, 2), dtype=np.uint32)
+    return _merge(np.concatenate(keys), np.eye(2, dtype=np.uint32)[np.concatenate(labels)])
+
+def _merge(keys, counts):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    merged = np.zeros((len(unique), 2), dtype=np.uint32)
+    np.add.at(merged, inverse, counts)
+    return unique, merged
+
+class KnownDomainIndex:
+    def __init__(self, path=INDEX_DIR):
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.keys = np.load(os.path.join(path, KEYS_FILE), mmap_mode='r')
+        self.counts = np.load(os.path.join(path, COUNTS_FILE), mmap_mode='r')
+        self.bloom = np.load(os.path.join(path, BLOOM_FILE), mmap_mode='r')
+        self.n_bits, self.n_hashes = len(self.bloom) * 8, self.meta['bloom_hashes']
+        self.lookups = self.url_hits = self.domain_hits = self.bloom_rejects = 0
+
+    def _find(self, hashes):
+        # label of every hash, -1 where the key is unknown or its rows disagree
+        labels = np.full(len(hashes), -1, dtype=np.int8)
+        if not len(self.keys) or not len(hashes):
+            return labels
+        positions = _bloom_positions(hashes, self.n_bits, self.n_hashes)
+        # packbits order, bit 0 of the filter is the high bit of byte 0
+        shifts = (np.uint64(7) - (positions & np.uint64(7))).astype(np.uint8)
+        maybe = ((self.bloom[(positions >> np.uint64(3)).astype(np.intp)] >> shifts) & 1).all(axis=1)
+        self.bloom_rejects += int((~maybe).sum())
+        candidates = np.flatnonzero(maybe)
+        slots = np.minimum(np.searchsorted(self.keys, hashes[candidates]), len(self.keys) - 1)
+        present = self.keys[slots] == hashes[candidates]
+        found, counts = candidates[present], self.counts[slots[present]]
+        pure = (counts == 0).any(axis=1)
+        labels[found[pure]] = (counts[pure, 1] > 0).astype(np.int8)
+        return labels
+
+    def lookup_batch(self, urls): #labels of raw urls, -1 for the ones the model has to score
+        normalized = normalize_urls(urls).tolist()
+        url_hashes, domain_hashes = url_keys(normalized)
+        labels = self._find(url_hashes)
+        by_url = labels >= 0
+        rest = np.flatnonzero(~by_url)
+        labels[rest] = self._find(domain_hashes[rest])
+        self.lookups += len(normalized)
+        self.url_hits += int(by_url.sum())
+        self.domain_hits += int((labels[rest] >= 0).sum())
+        return labels
+
+    def _find_one(self, key):
+        # _find for a single hash with plain ints, no arrays to set up
+        high, step = key >> 32, (key & 0xFFFFFFFF) | 1
+        for i in range(self.n_hashes):
+            position = (high + i * step) % self.n_bits
+            if not (self.bloom[position >> 3] >> (7 - (position & 7))) & 1:
+                self.bloom_rejects += 1
+                return -1
+        slot = int(np.searchsorted(self.keys, np.uint64(key)))
+        if slot == len(self.keys) or self.keys[slot] != key:
+            return -1
+        benign, malicious = self.counts[slot].tolist()
+        return -1 if benign and malicious else int(malicious > 0)
+
+    def lookup(self, url): #label of one raw url or None, for scoring urls one at a time
+        url = url.lower().replace('www.', '') if isinstance(url, str) else ''  # as normalize_urls does
+        self.lookups += 1
+        label = self._find_one(key_hash('u:' + url))
+        if label >= 0:
+            self.url_hits += 1
+            return label
+        label = self._find_one(key_hash('d:' + registered_domain(domains.hostname(url))))
+        if label >= 0:
+            self.domain_hits += 1
+            return label
+        return None
+
+    def stats(self):
+        hits = self.url_hits + self.domain_hits
+        return {
+            'index_keys': len(self.keys),
+            'index_lookups': self.lookups,
+            'index_url_hits': self.url_hits,
+            'index_domain_hits': self.domain_hits,
+            'index_bloom_rejects': self.bloom_rejects,
+            'index_hit_rate': hits / self.lookups if self.lookups else None,
+        }
+
+def update_index(filename, path=INDEX_DIR):
+    # Adds the labeled rows of filename to the index at path, building it when
+    # there is none. A file that was already added (same sha256) is skipped
+    digest = file_digest(filename)
+    meta = {'sources': [], 'rows': 0}
+    keys, counts = np.empty(0, dtype=np.uint64), np.empty((0, 2), dtype=np.uint32)
+    if os.path.exists(os.path.join(path, META_FILE)):
+        index = KnownDomainIndex(path)
+        meta, keys, counts = index.meta, np.asarray(index.keys), np.asarray(index.counts)
+        if digest in [source['sha256'] for source in meta['sources']]:
+            return meta
+
+    new_keys, new_counts = _read_counts(filename)
+    keys, counts = _merge(np.concatenate([keys, new_keys]), np.concatenate([counts, new_counts]))
+    answering = keys[(counts == 0).any(axis=1)]
+    bloom, n_hashes = _build_bloom(answering)
+    meta = {
+        'sources': meta['sources'] + [{'file': os.path.abspath(filename), 'sha256': digest}],
+        'rows': meta['rows'] + int(new_counts.sum()) // 2,
+        'keys': len(keys),
+        'answering_keys': len(answering),
+        'bloom_hashes': n_hashes,
+        'bloom_bytes': len(bloom),
+    }
+
+    # Written to a staging directory and swapped in so readers never see half an index
+    parent = os.path.dirname(os.path.abspath(path))
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=parent)
+    np.save(os.path.join(staging, KEYS_FILE), keys)
+    np.save(os.path.join(staging, COUNTS_FILE), counts)
+    np.save(os.path.join(staging, BLOOM_FILE), bloom)
+    with open(os.path.join(staging, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+    retired = None
+    if os.path.exists(path):
+        retired = tempfile.mkdtemp(prefix='.retired-', dir=parent)
+        os.replace(path, os.path.join(retired, 'index'))
+    os.replace(staging, path)
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+    return meta
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the known domain index from labeled urls")
+    parser.add_argument('files', nargs='*', default=['cleaned_data.csv'], help="labeled csv files, url,label")
+    parser.add_argument('--index', default=INDEX_DIR)
+    args = parser.parse_args()
+
+    try:
+        for filename in args.files:
+            meta = update_index(filename, args.index)
+    except FileNotFoundError as e:
+        print(f"The file {e.filename} was not found.")
+        sys.exit(1)
+    print(f"{args.index}: {meta['rows']} labeled rows, {meta['keys']} keys, {meta['answering_keys']} with one label,"
+          f" Bloom filter {meta['bloom_bytes'] / 1024:.0f} KiB")
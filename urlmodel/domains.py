@@ -0,0 +1,143 @@
+#Offline domain parser used in place of tldextract.extract. The public suffix
+#list snapshot ships next to this file so nothing is downloaded, the suffix
+#trie is built once at import and every hostname is parsed at most once while
+#it stays in the LRU cache
+
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+from ipaddress import AddressValueError, IPv6Address
+
+try:
+    import idna #same punycode decoding tldextract uses
+except ImportError:
+    idna = None
+
+SUFFIX_LIST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public_suffix_list.dat')
+
+#hostnames kept in the LRU cache, real traffic repeats the same hosts a lot
+HOST_CACHE_SIZE = 1 << 18
+
+ExtractResult = namedtuple('ExtractResult', ['subdomain', 'domain', 'suffix'])
+
+SUFFIX_PATTERN = re.compile(r'^(?P<suffix>[.*!]*\w[\S]*)', re.UNICODE | re.MULTILINE)
+PRIVATE_DOMAINS_MARKER = '// ===BEGIN PRIVATE DOMAINS==='
+IP_PATTERN = re.compile(
+    r'^(?:(?:[0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])\.)'
+    r'{3}(?:[0-9]|[1-9][0-9]|1[0-9]{2}|2[0-4][0-9]|25[0-5])$',
+    re.ASCII,
+)
+SCHEME_CHARS = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.')
+
+class _Node:
+    __slots__ = ('matches', 'end')
+
+    def __init__(self):
+        self.matches = {}
+        self.end = False
+
+def load_suffixes(filename=SUFFIX_LIST_FILE): #icann suffixes only, like tldextract's default
+    with open(filename, encoding='utf-8') as f:
+        public_text = f.read().partition(PRIVATE_DOMAINS_MARKER)[0]
+    return [m.group('suffix') for m in SUFFIX_PATTERN.finditer(public_text)]
+
+def build_trie(suffixes): #labels are stored right to left, 'co.uk' becomes uk -> co
+    root = _Node()
+    for suffix in suffixes:
+        node = root
+        for label in reversed(suffix.split('.')):
+            node = node.matches.setdefault(label, _Node())
+        node.end = True
+    return root
+
+SUFFIX_TRIE = build_trie(load_suffixes())
+
+def trie_paths(node=SUFFIX_TRIE, labels=()): #(dotted suffix, node) for every node below node, 'co.uk' for uk -> co
+    for label, child in node.matches.items():
+        path = (label,) + labels
+        yield '.'.join(path), child
+        yield from trie_paths(child, path)
+
+def _decode_punycode(label):
+    lowered = label.lower()
+    if lowered.startswith('xn--'):
+        try:
+            return idna.decode(lowered) if idna else lowered.encode('ascii').decode('idna')
+        except (UnicodeError, IndexError):
+            pass
+    return lowered
+
+def _schemeless(url):
+    double_slashes = url.find('//')
+    if double_slashes == 0:
+        return url[2:]
+    if (
+        double_slashes < 2
+        or url[double_slashes - 1] != ':'
+        or set(url[:double_slashes - 1]) - SCHEME_CHARS
+    ):
+        return url
+    return url[double_slashes + 2:]
+
+def hostname(url): #host part of a url the same lenient way tldextract finds it
+    authority = _schemeless(url).partition('/')[0].partition('?')[0].partition('#')[0]
+    after_userinfo = authority.rpartition('@')[-1]
+    if after_userinfo and after_userinfo[0] == '[':
+        maybe_ipv6 = after_userinfo.partition(']')
+        if maybe_ipv6[1] == ']':
+            return maybe_ipv6[0] + ']'
+    return after_userinfo.partition(':')[0].strip().rstrip('.。．｡')
+
+def _suffix_index(labels, trie=SUFFIX_TRIE): #index of the first suffix label, None when nothing matches
+    node = trie
+    suffix_index = label_index = len(labels)
+    for label in reversed(labels):
+        decoded = _decode_punycode(label)
+        if decoded in node.matches:
+            label_index -= 1
+            node = node.matches[decoded]
+            if node.end:
+                suffix_index = label_index
+            continue
+        if '*' in node.matches:
+            return label_index if '!' + decoded in node.matches else label_index - 1
+        break
+    return None if suffix_index == len(labels) else suffix_index
+
+@lru_cache(maxsize=HOST_CACHE_SIZE)
+def extract_host(host): #splits an already isolated hostname, results are memoized
+    host = host.replace('。', '.').replace('．', '.').replace('｡', '.')
+    if len(host) >= 4 and host[0] == '[' and host[-1] == ']':
+        try:
+            IPv6Address(host[1:-1])
+            return ExtractResult('', host, '')
+        except AddressValueError:
+            pass
+
+    labels = host.split('.')
+    index = _suffix_index(labels)
+    if index is None:
+        if len(labels) == 4 and host[:1].isdecimal() and IP_PATTERN.fullmatch(host):
+            return ExtractResult('', host, '')
+        return ExtractResult('.'.join(labels[:-1]), labels[-1], '')
+    subdomain = '.'.join(labels[:index - 1]) if index >= 2 else ''
+    domain = labels[index - 1] if index > 0 else ''
+    return ExtractResult(subdomain, domain, '.'.join(labels[index:]))
+
+def extract(url): #drop in for tldextract.extract, gives the same subdomain/domain/suffix split
+    return extract_host(hostname(url))
+
+def cache_stats(): #how well the hostname cache is doing
+    info = extract_host.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
+
+def clear_cache():
+    extract_host.cache_clear()
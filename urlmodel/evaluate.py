@@ -0,0 +1,273 @@
+#Evaluation engine: the model scores the test rows once with predict_proba
+#and everything else is derived from counts kept in an Evaluation. The
+#confusion matrix of the model's own predictions (argmax of the
+#probabilities, what predict returns) gives the classification report and
+#accuracy. The malicious and benign rows counted per malicious probability,
+#rounded down to a multiple of RESOLUTION, give the confusion counts at every
+#threshold in one cumulative sum, and from them the ROC and PR curves and an
+#operating threshold. At the grid thresholds the counts are exact, the curves
+#are the ones sklearn draws from the raw scores up to rows whose scores share
+#a 1/65536 wide bin. There are at most 65537 thresholds whatever the size of
+#the test set, and counts add up, so test sets too big for memory are scored
+#a batch at a time and the result is the same. An Evaluation is saved as json
+#so reports and charts can be redrawn without the model
+#
+#  python -m urlmodel.evaluate model_artifact test.csv --output evaluation.json
+
+import argparse
+import json
+import sys
+
+import numpy as np #for data analysis
+from sklearn.metrics import classification_report
+
+POSITIVE = 1  # malicious
+CHUNK_ROWS = 100_000
+#width of the score bins, a power of two so scores are binned without rounding error
+RESOLUTION = 2 ** -16
+
+class Evaluation:
+    def __init__(self, classes, positive=POSITIVE):
+        self.classes = np.asarray(classes)  # the model's classes_, the columns of predict_proba
+        self.labels = np.unique(self.classes)  # rows and columns of the confusion matrix
+        self.confusion = np.zeros((len(self.labels), len(self.labels)), dtype=np.int64)
+        self.positive = positive
+        # malicious probabilities seen, rounded down to the grid, ascending, and the rows of each class
+        # at each one. They are the thresholds: a row is called malicious when its probability is >= the threshold
+        self.thresholds = np.empty(0, dtype=np.float64)
+        self.positive_counts = np.empty(0, dtype=np.int64)
+        self.negative_counts = np.empty(0, dtype=np.int64)
+
+    def _add_labels(self, values):
+        # true labels the model has no class for get a row and column of their own
+        labels = np.union1d(self.labels, values)
+        if len(labels) > len(self.labels):
+            at = np.searchsorted(labels, self.labels)
+            confusion = np.zeros((len(labels), len(labels)), dtype=np.int64)
+            confusion[np.ix_(at, at)] = self.confusion
+            self.labels, self.confusion = labels, confusion
+
+    def update(self, y_true, proba): #adds a batch of true labels and predict_proba rows
+        y_true = np.asarray(y_true)
+        proba = np.asarray(proba)
+        y_pred = self.classes.take(proba.argmax(axis=1))
+        self._add_labels(np.unique(y_true))
+        n = len(self.labels)
+        cells = np.searchsorted(self.labels, y_true) * n + np.searchsorted(self.labels, y_pred)
+        self.confusion += np.bincount(cells, minlength=n * n).reshape(n, n)
+        if self.positive in self.classes:
+            score = proba[:, list(self.classes).index(self.positive)].astype(np.float64)
+            # p >= k * RESOLUTION exactly when the rounded down p is, so no threshold on the grid moves
+            self._add_scores(np.floor(score / RESOLUTION) * RESOLUTION, y_true == self.positive)
+        return self
+
+    def _add_scores(self, score, is_positive):
+        values, inverse = np.unique(score, return_inverse=True)
+        thresholds = np.union1d(self.thresholds, values)
+        positive_counts = np.zeros(len(thresholds), dtype=np.int64)
+        negative_counts = np.zeros(len(thresholds), dtype=np.int64)
+        at = np.searchsorted(thresholds, self.thresholds)
+        positive_counts[at] = self.positive_counts
+        negative_counts[at] = self.negative_counts
+        at = np.searchsorted(thresholds, values)
+        positive_counts[at] += np.bincount(inverse[is_positive], minlength=len(values))
+        negative_counts[at] += np.bincount(inverse[~is_positive], minlength=len(values))
+        self.thresholds, self.positive_counts, self.negative_counts = thresholds, positive_counts, negative_counts
+
+    @property
+    def rows(self):
+        return int(self.confusion.sum())
+
+    @property
+    def accuracy(self):
+        return float(np.trace(self.confusion) / self.rows) if self.rows else 0.0
+
+    def classification_report(self, output_dict=False, digits=2):
+        # sklearn's report of the confusion matrix, every cell weighted by its count
+        true, pred = np.indices(self.confusion.shape)
+        report = classification_report(
+            self.labels[true.ravel()], self.labels[pred.ravel()], labels=self.labels,
+            sample_weight=self.confusion.ravel(), output_dict=True, zero_division=0,
+        )
+        for name, row in report.items():
+            if isinstance(row, dict):
+                row['support'] = int(row['support'])
+        return report if output_dict else _format_report(report, digits)
+
+    def threshold_counts(self):
+        # (tp, fp, fn, tn) per threshold, a row is called malicious when its probability is >= the threshold
+        tp = np.cumsum(self.positive_counts[::-1])[::-1]
+        fp = np.cumsum(self.negative_counts[::-1])[::-1]
+        return tp, fp, tp[0] - tp, fp[0] - fp
+
+    def roc_curve(self): #(false positive rate, true positive rate, thresholds), thresholds descending
+        tp, fp, fn, tn = self.threshold_counts()
+        fpr = np.append(fp / max(fp[0], 1), 0.0)[::-1]
+        tpr = np.append(tp / max(tp[0], 1), 0.0)[::-1]
+        return fpr, tpr, np.append(self.thresholds, np.inf)[::-1]
+
+    def pr_curve(self): #(precision, recall, thresholds) like sklearn's precision_recall_curve
+        tp, fp, fn, tn = self.threshold_counts()
+        called = tp + fp
+        keep = called > 0
+        precision = np.append(tp[keep] / called[keep], 1.0)
+        recall = np.append(tp[keep] / max(tp[0], 1), 0.0)
+        return precision, recall, self.thresholds[keep]
+
+    def roc_auc(self):
+        fpr, tpr, _ = self.roc_curve()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    def average_precision(self):
+        precision, recall, _ = self.pr_curve()
+        return float(-np.sum(np.diff(recall) * precision[:-1]))
+
+    def choose_threshold(self, metric='f1', min_precision=None):
+        # The operating threshold with the best f1 or accuracy, or with
+        # min_precision the one that keeps precision at least that high and
+        # catches the most malicious urls. Returns (threshold, metrics there)
+        tp, fp, fn, tn = self.threshold_counts()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+            recall = tp / max(tp[0], 1)
+            f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        accuracy = (tp + tn) / max(tp[0] + fp[0], 1)
+        if min_precision is not None:
+            candidates = np.flatnonzero(precision >= min_precision)
+            if not len(candidates):
+                return None, None
+            best = candidates[np.argmax(recall[candidates])]
+        else:
+            best = int(np.argmax({'f1': f1, 'accuracy': accuracy}[metric]))
+        return float(self.thresholds[best]), {
+            'precision': float(precision[best]), 'recall': float(recall[best]), 'f1': float(f1[best]),
+            'accuracy': float(accuracy[best]), 'false_positives': int(fp[best]), 'false_negatives': int(fn[best]),
+        }
+
+    def to_dict(self):
+        return {
+            'classes': self.classes.tolist(),
+            'labels': self.labels.tolist(),
+            'confusion': self.confusion.tolist(),
+            'positive': self.positive,
+            'thresholds': self.thresholds.tolist(),
+            'positive_counts': self.positive_counts.tolist(),
+            'negative_counts': self.negative_counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        evaluation = cls(data['classes'], data['positive'])
+        evaluation.labels = np.asarray(data['labels'])
+        evaluation.thresholds = np.asarray(data['thresholds'], dtype=np.float64)
+        evaluation.confusion = np.asarray(data['confusion'], dtype=np.int64)
+        evaluation.positive_counts = np.asarray(data['positive_counts'], dtype=np.int64)
+        evaluation.negative_counts = np.asarray(data['negative_counts'], dtype=np.int64)
+        return evaluation
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+def _format_report(report, digits=2):
+    # the text layout of sklearn's classification_report, supports as whole rows
+    headers = ['precision', 'recall', 'f1-score', 'support']
+    names = [name for name in report if name not in ('accuracy', 'macro avg', 'weighted avg', 'micro avg')]
+    width = max([len(name) for name in names] + [len('weighted avg'), digits])
+    row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+    text = ("{:>{width}s} " + " {:>9}" * len(headers)).format('', *headers, width=width) + "\n\n"
+    for name in names:
+        row = report[name]
+        text += row_fmt.format(name, row['precision'], row['recall'], row['f1-score'], row['support'],
+                               width=width, digits=digits)
+    text += "\n"
+    for name in ('micro avg', 'accuracy', 'macro avg', 'weighted avg'):
+        if name not in report:
+            continue
+        if name == 'accuracy':
+            support = report['macro avg']['support']
+            text += ("{:>{width}s} " + " {:>9.{digits}}" * 2 + " {:>9.{digits}f}" + " {:>9}\n").format(
+                name, '', '', report[name], support, width=width, digits=digits)
+        else:
+            row = report[name]
+            text += row_fmt.format(name, row['precision'], row['recall'], row['f1-score'], row['support'],
+                                   width=width, digits=digits)
+    return text
+
+def _predict_proba(model, X):
+    if hasattr(model, 'predict_proba'):
+        return model.predict_proba(X)
+    # models without probabilities count as sure of their prediction
+    return (model.predict(X)[:, None] == np.asarray(model.classes_)[None, :]).astype(np.float64)
+
+def evaluate(model, X_test, y_test):
+    # one predict_proba over the whole test set
+    return Evaluation(model.classes_).update(y_test, _predict_proba(model, X_test))
+
+def evaluate_batches(model, batches, evaluation=None):
+    # streaming mode: batches yields (X, y), e.g. streaming.iter_partitions(output_dir, 'test')
+    for X, y in batches:
+        if len(X):
+            evaluation = evaluation or Evaluation(model.classes_)
+            evaluation.update(y, _predict_proba(model, X))
+    return evaluation
+
+def csv_batches(artifact, filename, chunk_rows=CHUNK_ROWS):
+    # (features, labels) of a labeled csv a chunk at a time, featurized the
+    # way the artifact was trained. Rows not labeled 0 or 1 are skipped
+    import pandas as pd #for datasets
+    from urlmodel.artifacts import prepare_features
+
+    for chunk in pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str},
+                             chunksize=chunk_rows, low_memory=False):
+        labels = pd.to_numeric(chunk['label'], errors='coerce')
+        chunk = chunk[labels.isin([0, 1])]
+        yield prepare_features(artifact, chunk['url'].fillna('').tolist()), labels[chunk.index].to_numpy(dtype=np.int64)
+
+def print_evaluation(evaluation):
+    print("Classification Report:")
+    print(evaluation.classification_report())
+    print("Accuracy Score:", evaluation.accuracy)
+    if evaluation.positive_counts.any() and evaluation.negative_counts.any():
+        threshold, at = evaluation.choose_threshold('f1')
+        print(f"ROC AUC: {evaluation.roc_auc():.4f}  average precision: {evaluation.average_precision():.4f}")
+        print(f"Best F1 threshold: {threshold:.3f} (precision {at['precision']:.4f}, recall {at['recall']:.4f})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a saved model artifact on a labeled csv, a chunk at a time")
+    parser.add_argument('model_dir')
+    parser.add_argument('filename', help="labeled csv, url,label")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--output', help="write the evaluation as json, urlmodel.plot draws it")
+    parser.add_argument('--min-precision', type=float, help="print the threshold that keeps at least this precision")
+    args = parser.parse_args(argv)
+
+    from urlmodel.score import load_artifact
+    try:
+        artifact = load_artifact(args.model_dir)
+        evaluation = evaluate_batches(artifact.model, csv_batches(artifact, args.filename, args.chunk_rows))
+    except FileNotFoundError as e:
+        print(f"The file {e.filename} was not found.")
+        sys.exit(1)
+    if evaluation is None:
+        print(f"No rows labeled 0 or 1 in {args.filename}")
+        sys.exit(1)
+    print_evaluation(evaluation)
+    if args.min_precision is not None:
+        threshold, at = evaluation.choose_threshold(min_precision=args.min_precision)
+        if threshold is None:
+            print(f"No threshold reaches precision {args.min_precision}")
+        else:
+            print(f"Threshold for precision >= {args.min_precision}: {threshold:.3f} (recall {at['recall']:.4f},"
+                  f" {at['false_positives']} false positives)")
+    if args.output:
+        evaluation.save(args.output)
+        print(f"Evaluation written to {args.output}")
+
+if __name__ == "__main__":
+    main()
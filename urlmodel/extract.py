@@ -0,0 +1,60 @@
+#Preprocesses a labeled csv (url,label rows) into the train and test feature
+#frames every model is fitted on. The features come from the feature cache,
+#the labels are read on their own and the split is taken by row position
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from sklearn.preprocessing import LabelEncoder
+
+from urlmodel.feature_cache import cached_features
+from urlmodel.feature_frame import compact_split, read_labels
+from urlmodel.instrumentation import stage
+
+#how the label column becomes the target, the pipelines were written against different label sets
+#  numeric: every row, labels that are not numbers become -1
+#  encoded: rows with a url and a label, every label value gets a class number
+#  binary:  rows labeled 0 (benign) or 1 (malicious) only
+LABEL_MODES = ('numeric', 'encoded', 'binary')
+
+def encode_labels(categories, mode):
+    # categories: the label column as read by read_labels. Returns the
+    # targets and a mask of the rows to keep
+    if mode == 'numeric':
+        numeric = pd.to_numeric(categories.categories, errors='coerce').fillna(-1)
+        return np.append(numeric.to_numpy(), -1).astype(np.int8)[categories.codes], None
+    if mode == 'encoded':
+        # Encode labels: 'bad' as 1 (malicious) and 'good' as 0 (benign)
+        label_encoder = LabelEncoder()
+        return label_encoder.fit_transform(categories.categories).astype(np.int8)[categories.codes], None
+    if mode == 'binary':
+        numeric = pd.to_numeric(categories.categories, errors='coerce').to_numpy()
+        labels = np.append(numeric, np.nan)[categories.codes]
+        keep = np.isin(labels, (0, 1))
+        return labels[keep].astype(np.int8), keep
+    raise ValueError(f"Unknown label mode {mode!r}, expected one of {LABEL_MODES}")
+
+def preprocess_data(filename, labels='numeric', return_scaler=False):
+    try:
+        # Only the label column is read (and the url column when rows with a
+        # missing url are dropped), the features come from the cache
+        with stage('load') as s:
+            rows, categories = read_labels(filename, dropna=labels != 'numeric')
+            s.rows = len(rows)
+        with stage('clean', rows=len(rows)) as s:
+            targets, keep = encode_labels(categories, labels)
+            if keep is not None:
+                rows = rows[keep]
+            del categories
+            s.rows = len(rows)
+
+        # Extract features for the whole url column at once, or load them from the cache
+        with stage('extract', rows=len(rows)):
+            features_df = cached_features(filename)
+
+        X_train, X_test, y_train, y_test, scaler = compact_split(features_df, targets, rows)
+        if return_scaler:
+            return X_train, X_test, y_train, y_test, scaler
+        return X_train, X_test, y_train, y_test
+    except Exception as e:
+        print(f"Failed to preprocess data: {e}")
+        raise
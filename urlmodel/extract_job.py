@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#Resumable feature extraction for url dumps too big to extract in one go.
+#The csv is cut into byte ranges that end on a line break and every range is
+#a shard extracted on its own, the finished shard is written to a staging
+#file and renamed into place so a crash never leaves half a shard behind. A
+#rerun skips the shards already on disk. Shards are handed out through claim
+#files created with O_EXCL in the job directory, so workers on several
+#machines sharing that directory pull from the same job; a claim older than
+#the lease, or made by a process of this host that is gone, is taken over.
+#When the last shard is in, the shards are joined into the feature_cache
+#entry the pipelines read
+#
+#Urls are expected one per line (cleaned_data.csv has no quoted line breaks)
+
+import argparse
+import io
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+
+from urlmodel.feature_cache import CACHE_DIR, META_FILE, _load_entry, _save_entry, file_digest
+from urlmodel.features import FEATURE_COLUMNS, FEATURE_VERSION, extract_features_batch, normalize_urls
+
+JOB_DIR = os.environ.get('URL_FEATURE_JOBS_DIR', '.feature_jobs')
+JOB_FILE = 'job.json'
+SHARD_BYTES = 64 * 1024 * 1024  # about a million urls
+LEASE_SECONDS = 3600  # a claim this old is taken over, shards take minutes
+POLL_SECONDS = 5
+
+def _shard_path(job_dir, shard):
+    return os.path.join(job_dir, 'shards', f"{shard:05d}.npz")
+
+def _claim_path(job_dir, shard):
+    return os.path.join(job_dir, 'claims', f"{shard:05d}")
+
+def shard_ranges(filename, shard_bytes=SHARD_BYTES):
+    # (begin, end) byte offsets, every boundary moved forward to the start of the next line
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for target in range(shard_bytes, size, shard_bytes):
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            if f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(begin, end) for begin, end in zip(bounds, bounds[1:]) if end > begin]
+
+def plan_job(filename, job_dir, digest, shard_bytes=SHARD_BYTES):
+    # Writes the shard plan, or returns the one already in job_dir. The first
+    # machine to link its plan into place wins, the others use that one
+    path = os.path.join(job_dir, JOB_FILE)
+    if not os.path.exists(path):
+        for sub in ('shards', 'claims'):
+            os.makedirs(os.path.join(job_dir, sub), exist_ok=True)
+        plan = {'sha256': digest, 'feature_version': FEATURE_VERSION, 'bytes': os.path.getsize(filename),
+                'shards': shard_ranges(filename, shard_bytes)}
+        fd, staging = tempfile.mkstemp(prefix='.staging-', dir=job_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(plan, f, indent=2)
+        try:
+            os.link(staging, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(staging)
+    with open(path) as f:
+        plan = json.load(f)
+    if plan['sha256'] != digest or plan['feature_version'] != FEATURE_VERSION:
+        raise ValueError(f"{job_dir} holds a job for another file or feature version")
+    return plan
+
+def _holder_died(path):
+    # a claim made on this host by a process that is gone, a restart after a
+    # crash does not have to wait for the lease
+    try:
+        with open(path) as f:
+            holder = json.load(f)
+    except ValueError:  # still being written
+        return False
+    if holder['host'] != socket.gethostname() or holder['pid'] == os.getpid():
+        return False
+    try:
+        os.kill(holder['pid'], 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def _try_claim(job_dir, shard, lease_seconds):
+    path = _claim_path(job_dir, shard)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        try:
+            expired = time.time() - os.path.getmtime(path) > lease_seconds or _holder_died(path)
+        except FileNotFoundError:
+            return False
+        if not expired:
+            return False
+        # only one of the workers racing for a dead claim gets to rename it away
+        try:
+            os.rename(path, f"{path}.expired-{uuid.uuid4().hex}")
+        except FileNotFoundError:
+            return False
+        return _try_claim(job_dir, shard, lease_seconds)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'claimed': time.time()}, f)
+    return True
+
+def extract_shard(filename, begin, end):
+    # Feature columns of the rows in one byte range, read the way the
+    # pipelines read the whole file
+    with open(filename, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    urls = pd.read_csv(io.BytesIO(data), header=None, usecols=[0], names=['url'], dtype={'url': str})['url']
+    features = extract_features_batch(normalize_urls(urls))
+    return {name: features[name].to_numpy() for name in FEATURE_COLUMNS}
+
+def _write_shard(job_dir, shard, columns):
+    path = _shard_path(job_dir, shard)
+    fd, staging = tempfile.mkstemp(prefix='.staging-', suffix='.npz', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staging, path)
+    except BaseException:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+
+def work(filename, job_dir, lease_seconds=LEASE_SECONDS):
+    # One worker: claims and extracts shards until none is left to claim.
+    # Returns how many shards it extracted
+    with open(os.path.join(job_dir, JOB_FILE)) as f:
+        shards = json.load(f)['shards']
+    done = 0
+    for shard, (begin, end) in enumerate(shards):
+        if os.path.exists(_shard_path(job_dir, shard)):
+            continue
+        try:
+            if not _try_claim(job_dir, shard, lease_seconds):
+                continue
+        except FileNotFoundError:  # the job was merged and removed meanwhile
+            break
+        if os.path.exists(_shard_path(job_dir, shard)):  # finished between the check and the claim
+            continue
+        _write_shard(job_dir, shard, extract_shard(filename, begin, end))
+        done += 1
+    return done
+
+def job_status(job_dir):
+    with open(os.path.join(job_dir, JOB_FILE)) as f:
+        n_shards = len(json.load(f)['shards'])
+    done = sum(os.path.exists(_shard_path(job_dir, shard)) for shard in range(n_shards))
+    claimed = sum(os.path.exists(_claim_path(job_dir, shard)) for shard in range(n_shards))
+    return {'shards': n_shards, 'done': done, 'running': claimed - done, 'pending': n_shards - claimed}
+
+def _remove_job(job_dir):
+    # Only what the job wrote, the job directory can be shared with other files.
+    # job.json goes first so other workers stop picking the job up
+    try:
+        os.remove(os.path.join(job_dir, JOB_FILE))
+    except FileNotFoundError:
+        pass
+    for sub in ('shards', 'claims'):
+        shutil.rmtree(os.path.join(job_dir, sub), ignore_errors=True)
+    try:
+        os.rmdir(job_dir)
+    except OSError:  # holds files of someone else
+        pass
+
+def merge_job(filename, job_dir, entry_dir):
+    # Joins the shards in order into the feature cache entry and removes the job
+    with open(os.path.join(job_dir, JOB_FILE)) as f:
+        n_shards = len(json.load(f)['shards'])
+    parts = [np.load(_shard_path(job_dir, shard)) for shard in range(n_shards)]
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in FEATURE_COLUMNS}
+    _save_entry(entry_dir, pd.DataFrame(columns, columns=FEATURE_COLUMNS, copy=False), filename)
+    del parts, columns
+    _remove_job(job_dir)
+
+def run_job(filename, n_jobs=None, job_dir=None, cache_dir=None, shard_bytes=SHARD_BYTES,
+            lease_seconds=LEASE_SECONDS, wait=True):
+    # Extracts the features of filename into the feature cache through a
+    # sharded job, joining the job when another machine already started it.
+    # Returns the cached features, or None when wait is off and shards are
+    # still being extracted elsewhere
+    digest = file_digest(filename)
+    key = f"{digest}-v{FEATURE_VERSION}"
+    entry_dir = os.path.join(cache_dir or CACHE_DIR, key)
+    job_dir = job_dir or os.path.join(JOB_DIR, key)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    while not os.path.exists(os.path.join(entry_dir, META_FILE)):
+        try:
+            plan = plan_job(filename, job_dir, digest, shard_bytes)
+            workers = min(n_jobs, len(plan['shards']))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(work, filename, job_dir, lease_seconds) for _ in range(workers)]
+                    for future in futures:
+                        future.result()
+            else:
+                work(filename, job_dir, lease_seconds)
+            status = job_status(job_dir)
+            if status['done'] == status['shards']:
+                merge_job(filename, job_dir, entry_dir)
+                continue
+        except FileNotFoundError:  # another machine merged the job while this one looked at it
+            continue
+        if not wait:
+            return None
+        else:
+            time.sleep(POLL_SECONDS)
+    return _load_entry(entry_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the features of a large csv as a resumable sharded job."
+                                                 " Run it on every machine sharing the job directory to split the work")
+    parser.add_argument('filename')
+    parser.add_argument('--jobs', type=int, default=None, help="local worker processes, default one per cpu")
+    parser.add_argument('--job-dir', help=f"shared job directory, default {JOB_DIR}/<sha256>-v<feature version>")
+    parser.add_argument('--shard-mb', type=float, default=SHARD_BYTES / 2 ** 20)
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help="seconds before a claimed shard is retried")
+    parser.add_argument('--no-wait', action='store_true', help="exit once nothing is left to claim here")
+    args = parser.parse_args()
+
+    try:
+        started = time.perf_counter()
+        features = run_job(args.filename, args.jobs, args.job_dir, shard_bytes=int(args.shard_mb * 2 ** 20),
+                           lease_seconds=args.lease, wait=not args.no_wait)
+    except FileNotFoundError:
+        print(f"The file {args.filename} was not found.")
+        sys.exit(1)
+    if features is None:
+        print("No shards left to claim here, the rest are being extracted by other workers")
+    else:
+        print(f"{len(features)} rows cached in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,85 @@
+#On-disk cache of the extracted feature matrix so the pipelines stop
+#re-extracting the same features from the same csv on every run. Entries are
+#keyed by the sha256 of the input file plus features.FEATURE_VERSION and
+#stored one .npy file per column, cache hits are memory mapped
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+
+from urlmodel.features import FEATURE_COLUMNS, FEATURE_VERSION, normalize_urls
+from urlmodel.parallel_features import extract_features_parallel
+
+CACHE_DIR = os.environ.get('URL_FEATURE_CACHE', '.feature_cache')
+META_FILE = 'meta.json'
+#workers used to extract on a cache miss and how, URL_FEATURE_JOBS=1 extracts serially
+FEATURE_JOBS = int(os.environ.get('URL_FEATURE_JOBS', 0)) or None
+FEATURE_BACKEND = os.environ.get('URL_FEATURE_BACKEND', 'process')
+#files at least this big are extracted as a resumable sharded job (urlmodel.extract_job)
+JOB_MIN_BYTES = int(os.environ.get('URL_FEATURE_JOB_BYTES', 1024 ** 3))
+
+def file_digest(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def cache_key(filename):
+    return f"{file_digest(filename)}-v{FEATURE_VERSION}"
+
+def _load_entry(entry_dir):
+    columns = {
+        name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')
+        for name in FEATURE_COLUMNS
+    }
+    return pd.DataFrame(columns, columns=FEATURE_COLUMNS, copy=False)
+
+def _save_entry(entry_dir, features, filename):
+    # Written to a temporary directory first so a crash never leaves half an entry behind
+    os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=os.path.dirname(entry_dir))
+    try:
+        for name in FEATURE_COLUMNS:
+            np.save(os.path.join(staging, f"{name}.npy"), features[name].to_numpy())
+        with open(os.path.join(staging, META_FILE), 'w') as f:
+            json.dump({'source': os.path.abspath(filename), 'rows': len(features),
+                       'feature_version': FEATURE_VERSION}, f, indent=2)
+        os.replace(staging, entry_dir)
+    except OSError:
+        # Another process stored the same entry first, theirs is just as good
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(entry_dir, META_FILE)):
+            raise
+
+def cached_features(filename, urls=None, cache_dir=None):
+    # Features for every row of filename read with header=None, like the
+    # pipelines do. urls can be passed when the caller already has that
+    # column in memory so a cache miss does not read the file twice
+    entry_dir = os.path.join(cache_dir or CACHE_DIR, cache_key(filename))
+    if os.path.exists(os.path.join(entry_dir, META_FILE)):
+        return _load_entry(entry_dir)
+    if os.path.getsize(filename) >= JOB_MIN_BYTES:
+        # a crash or a restart picks up from the shards already extracted
+        from urlmodel.extract_job import run_job
+        return run_job(filename, FEATURE_JOBS, cache_dir=cache_dir)
+
+    if urls is None:
+        urls = pd.read_csv(filename, header=None, usecols=[0], names=['url'], dtype={'url': str})['url']
+    features = extract_features_parallel(normalize_urls(urls), FEATURE_JOBS, FEATURE_BACKEND).reset_index(drop=True)
+    _save_entry(entry_dir, features, filename)
+    return features
+
+def clear_cache(cache_dir=None):
+    shutil.rmtree(cache_dir or CACHE_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m urlmodel.feature_cache <filename>  (extracts and caches the features of a csv)")
+        sys.exit(1)
+
+    features = cached_features(sys.argv[1])
+    print(f"{len(features)} rows cached under {os.path.join(CACHE_DIR, cache_key(sys.argv[1]))}")
@@ -0,0 +1,76 @@
+#Builds the train and test feature frames straight from the compact feature
+#columns, one column at a time. The url strings never sit next to the
+#features, nothing is concatenated and the rows are split by index, so the
+#only full size allocations are the two frames the model is fitted and
+#evaluated on: float32 scaled counts, uint8 flags and int32 hashes
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from pandas.api.types import union_categoricals
+from sklearn.model_selection import train_test_split #to split dataset into subsets for training and testing
+from sklearn.preprocessing import StandardScaler #to normalize features
+
+from urlmodel.features import BATCH_ROWS, FEATURE_COLUMNS, SCALED_COLUMNS
+from urlmodel.instrumentation import stage
+
+#row positions, they end up as the index of the train and test frames
+ROW_DTYPE = np.int32
+
+def read_labels(filename, dropna=False, chunk_rows=BATCH_ROWS):
+    # The label column of a csv read with header=None as a categorical, in
+    # chunks. With dropna rows missing a url or label are left out, the url
+    # column is read a chunk at a time for that and dropped straight away.
+    # Returns the positions of the rows kept and their labels
+    columns = ['url', 'label'] if dropna else ['label']
+    rows, labels, offset = [], [], 0
+    chunks = pd.read_csv(filename, header=None, names=['url', 'label'], usecols=columns,
+                         dtype={'url': str, 'label': 'category'}, chunksize=chunk_rows)
+    for chunk in chunks:
+        keep = chunk.notna().all(axis=1).to_numpy() if dropna else np.ones(len(chunk), dtype=bool)
+        rows.append((np.flatnonzero(keep) + offset).astype(ROW_DTYPE))
+        labels.append(chunk['label'].array[keep])
+        offset += len(chunk)
+    if not labels:
+        return np.empty(0, dtype=ROW_DTYPE), pd.Categorical([])
+    # labels only seen on dropped rows would leave gaps in the class numbers
+    return np.concatenate(rows), union_categoricals(labels).remove_unused_categories()
+
+def fit_scaler(features, rows, columns=SCALED_COLUMNS, chunk_rows=BATCH_ROWS):
+    # partial_fit over row slices keeps the float64 copy one slice big
+    scaler = StandardScaler()
+    for begin in range(0, len(rows), chunk_rows):
+        scaler.partial_fit(features[columns].iloc[rows[begin:begin + chunk_rows]].astype(np.float64))
+    return scaler
+
+def take_rows(features, rows, scaler, columns=SCALED_COLUMNS, chunk_rows=BATCH_ROWS):
+    # features can be the memory mapped cache entry, only the taken rows are copied
+    frame = {}
+    for name in FEATURE_COLUMNS:
+        source = features[name].to_numpy()
+        if name not in columns:
+            frame[name] = source[rows]
+            continue
+        # the same float64 arithmetic StandardScaler.transform does, a slice at a time
+        j = columns.index(name)
+        scaled = np.empty(len(rows), dtype=np.float32)
+        for begin in range(0, len(rows), chunk_rows):
+            part = source[rows[begin:begin + chunk_rows]].astype(np.float64)
+            part -= scaler.mean_[j]
+            part /= scaler.scale_[j]
+            scaled[begin:begin + len(part)] = part
+        frame[name] = scaled
+    return pd.DataFrame(frame, index=rows, columns=FEATURE_COLUMNS, copy=False)
+
+def compact_split(features, labels, rows=None, test_size=0.2, random_state=42):
+    # rows: positions in features to keep (after dropping rows with missing
+    # values), labels lines up with them. The split is the one
+    # train_test_split makes on the full frame, just taken by position
+    rows = np.arange(len(features), dtype=ROW_DTYPE) if rows is None else np.asarray(rows)
+    labels = np.asarray(labels)
+    with stage('split', rows=len(rows)):
+        train, test, y_train, y_test = train_test_split(rows, labels, test_size=test_size, random_state=random_state)
+    with stage('scale', rows=len(rows)):
+        scaler = fit_scaler(features, rows)
+        del rows, labels
+        X_train, X_test = take_rows(features, train, scaler), take_rows(features, test, scaler)
+    return X_train, X_test, pd.Series(y_train, index=train, name='label'), pd.Series(y_test, index=test, name='label'), scaler
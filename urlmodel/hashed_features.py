@@ -0,0 +1,94 @@
+#Alternative feature engine: character n-grams and url tokens (host, path,
+#query) hashed into a fixed width sparse CSR matrix. murmurhash is seeded
+#and stable, so the same url gets the same columns in every process, on
+#every host and between training and scoring. Models train on the sparse
+#matrix directly, nothing is ever densified
+
+import re
+import sys
+from functools import partial
+
+import numpy as np #for data analysis
+import pandas as pd #for datasets
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split #to split dataset into subsets for training and testing
+
+from urlmodel import domains
+from urlmodel.features import HASH_SEED, normalize_urls
+
+N_FEATURES = 2 ** 18
+NGRAM_RANGE = (3, 5)
+PATH_SPLIT = re.compile(r'[/._\-=~+%]+')
+
+def url_tokens(url, seed=HASH_SEED, ngram_range=NGRAM_RANGE):
+    # Every token carries the seed so a different seed gives an independent hashing
+    salt = f"{seed}:"
+    host = domains.hostname(url)
+    ext = domains.extract_host(host)
+    tokens = [salt + 'h=' + host, salt + 't=' + ext.suffix, salt + 'd=' + ext.domain + '.' + ext.suffix]
+    tokens += [salt + 'hl=' + label for label in host.split('.') if label]
+
+    rest = url.split(host, 1)[1] if host and host in url else url
+    path, _, query = rest.partition('#')[0].partition('?')
+    tokens += [salt + 'p=' + part for part in PATH_SPLIT.split(path) if part]
+    tokens += [salt + 'q=' + pair.partition('=')[0] for pair in query.split('&') if pair]
+
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        tokens += [salt + 'c=' + url[i:i + n] for i in range(len(url) - n + 1)]
+    return tokens
+
+def make_vectorizer(n_features=N_FEATURES, seed=HASH_SEED):
+    return HashingVectorizer(
+        analyzer=partial(url_tokens, seed=seed),
+        n_features=n_features,
+        alternate_sign=False,
+        norm='l2',
+        dtype=np.float32,
+    )
+
+def transform_urls(urls, n_features=N_FEATURES, seed=HASH_SEED): #raw urls to a CSR matrix
+    return make_vectorizer(n_features, seed).transform(normalize_urls(urls).tolist())
+
+def preprocess_data_hashed(filename, n_features=N_FEATURES, seed=HASH_SEED):
+    try:
+        data = pd.read_csv(filename, header=None, names=['url', 'label'], dtype={'url': str}, low_memory=False)
+        labels = pd.to_numeric(data['label'], errors='coerce').fillna(-1)  # Handle non-numeric labels gracefully
+
+        X = transform_urls(data['url'], n_features, seed)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, labels, test_size=0.2, random_state=42
+        )
+        return X_train, X_test, y_train, y_test
+    except Exception as e:
+        print(f"Failed to preprocess data: {e}")
+        raise
+
+def train_model_hashed(X_train, y_train):
+    try:
+        # Forests pick split candidates column by column, on hundreds of thousands
+        # of sparse columns that takes minutes per tree. A linear model works on
+        # the CSR matrix directly and trains in seconds
+        model = LogisticRegression(max_iter=1000)
+        model.fit(X_train, y_train)
+        return model
+    except Exception as e:
+        print(f"Failed to train model: {e}")
+        raise
+
+if __name__ == "__main__":
+    from urlmodel.train import evaluate_model
+    from urlmodel.artifacts import save_model
+
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'cleaned_data.csv'
+    model_dir = 'model_artifact_hashed'
+    try:
+        X_train, X_test, y_train, y_test = preprocess_data_hashed(filename)
+        model = train_model_hashed(X_train, y_train)
+        evaluate_model(model, X_test, y_test)
+        save_model(model_dir, model, None, feature_engine={'name': 'hashed', 'n_features': N_FEATURES, 'seed': HASH_SEED})
+    except FileNotFoundError:
+        print(f"The file {filename} was not found.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
@@ -0,0 +1,177 @@
+#Per stage instrumentation for the pipelines. Wrapping a step in
+#`with stage('extract', rows=n):` records wall time, cpu time, the resident
+#memory at the start and end of the stage, the peak it reached in between and
+#row counts in the same pass as the real work. On linux the kernel's resident
+#high-water mark is reset when a stage starts (/proc/self/clear_refs) and read
+#when it ends, so memory a stage allocates and frees again still shows. Without
+#procfs the peak is exact only when the stage raised the process peak, else it
+#is the larger of the start and end sizes. Turned on with enable() or
+#URL_TRACE=1, when it is off stage() hands back one shared object that does
+#nothing
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+_enabled = os.environ.get('URL_TRACE', '') not in ('', '0')
+_records = []
+_lock = threading.Lock()
+_epoch = time.perf_counter()
+_open = []  # stages being measured, a reset of the high-water mark folds it into all of them
+_process_peak = 0.0  # high-water mark of the process across resets
+#record fields shown with each stage in the trace viewer
+TRACE_ARGS = ('cpu_s', 'rss_start_mb', 'rss_end_mb', 'mem_delta_mb', 'peak_mem_mb', 'peak_mem_delta_mb', 'rows', 'failed')
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+def is_enabled():
+    return _enabled
+
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except OSError:  # no procfs (macos), the peak is the closest there is
+        return _peak_rss_mb()
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _high_water_mb(): #VmHWM, the resident peak since the last reset, None without procfs
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_high_water():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _fold_high_water(): #called with _lock held, before a reset and when a stage ends
+    global _process_peak
+    peak = _high_water_mb()
+    if peak is not None:
+        _process_peak = max(_process_peak, peak)
+        for open_stage in _open:
+            open_stage._peak = max(open_stage._peak, peak)
+
+def process_peak_mb(): #resident peak of the whole process, the stage resets do not lower it
+    with _lock:
+        _fold_high_water()
+        return max(_process_peak, _peak_rss_mb() if _high_water_mb() is None else 0.0)
+
+class _Stage:
+    __slots__ = ('name', 'rows', '_wall', '_cpu', '_rss', '_peak', '_max_rss', '_reset')
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        with _lock:
+            _fold_high_water()
+            self._rss = self._peak = _rss_mb()
+            self._max_rss = _peak_rss_mb()
+            self._reset = _reset_high_water()
+            _open.append(self)
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        rss = _rss_mb()
+        with _lock:
+            _fold_high_water()
+            _open.remove(self)
+        peak = max(self._peak, rss)
+        if not self._reset and _peak_rss_mb() > self._max_rss:
+            peak = _peak_rss_mb()  # the process peak was reached during this stage
+        record = {
+            'stage': self.name,
+            'start_s': self._wall - _epoch,
+            'wall_s': ended - self._wall,
+            'cpu_s': time.process_time() - self._cpu,
+            'rss_start_mb': self._rss,
+            'rss_end_mb': rss,
+            'mem_delta_mb': rss - self._rss,
+            'peak_mem_mb': peak,
+            'peak_mem_delta_mb': peak - self._rss,
+            'rows': self.rows,
+            'thread': threading.get_ident(),
+            'failed': exc_type is not None,
+        }
+        with _lock:
+            _records.append(record)
+        return False
+
+class _NoopStage:
+    __slots__ = ()
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value): # rows set inside a disabled stage are dropped
+        pass
+
+_NOOP = _NoopStage()
+
+def stage(name, rows=None): #context manager, rows can also be set on the returned object
+    return _Stage(name, rows) if _enabled else _NOOP
+
+def records():
+    with _lock:
+        return list(_records)
+
+def reset():
+    with _lock:
+        _records.clear()
+
+def report(out=None): #plain text table of the recorded stages
+    out = out or sys.stdout
+    out.write(f"{'stage':12s} {'wall s':>9s} {'cpu s':>9s} {'peak +MB':>9s} {'end +MB':>9s} {'rows':>11s}\n")
+    for record in records():
+        rows = '' if record['rows'] is None else str(record['rows'])
+        out.write(f"{record['stage']:12s} {record['wall_s']:9.3f} {record['cpu_s']:9.3f} "
+                  f"{record['peak_mem_delta_mb']:9.1f} {record['mem_delta_mb']:9.1f} {rows:>11s}\n")
+
+def write_json(path):
+    with open(path, 'w') as f:
+        json.dump({'pid': os.getpid(), 'stages': records()}, f, indent=2)
+
+def write_trace(path): #chrome trace event format, opens in chrome://tracing and perfetto
+    events = [
+        {
+            'name': record['stage'],
+            'ph': 'X',
+            'ts': record['start_s'] * 1e6,
+            'dur': record['wall_s'] * 1e6,
+            'pid': os.getpid(),
+            'tid': record['thread'],
+            'args': {key: record[key] for key in TRACE_ARGS},
+        }
+        for record in records()
+    ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,76 @@
+#Charts of a trained model. Only imported when a chart is asked for, so
+#training and scoring runs never load matplotlib. The evaluation charts are
+#drawn from a urlmodel.evaluate.Evaluation, also one saved earlier:
+#
+#  python -m urlmodel.plot model_artifact/evaluation.json --chart curves
+
+import argparse
+
+import matplotlib.pyplot as plt #for graphs
+import numpy as np #for data analysis
+from sklearn.metrics import classification_report
+
+def graph_report(class_report): #graphs precision and accuracy of a classification_report dict
+    #precision and accuracy label on the x axis 
+    pax = ['Precision (Weighted Avg)', 'Accuracy']
+    pa_values = [class_report['weighted avg']['precision'], class_report['accuracy']]
+
+    plt.figure(figsize=(10,6))
+    plt.title("Precision and Accuracy")
+    plt.yticks(np.arange(0, 1, 0.05))
+    plt.bar(range(len(pa_values)), pa_values)
+    plt.xlabel("Categories")
+    plt.ylabel("Values")
+    plt.xticks(range(len(pax)), pax) 
+    plt.show()
+
+def graph_data(y_test, y_pred): #graphs precision and accuracy
+    graph_report(classification_report(y_test,y_pred, output_dict=True))
+
+def graph_curves(evaluation): #ROC and precision-recall curves of the malicious class
+    fpr, tpr, _ = evaluation.roc_curve()
+    precision, recall, _ = evaluation.pr_curve()
+
+    fig, (roc, pr) = plt.subplots(1, 2, figsize=(12, 6))
+    roc.plot(fpr, tpr)
+    roc.plot([0, 1], [0, 1], linestyle='--', color='grey')
+    roc.set_title(f"ROC (AUC {evaluation.roc_auc():.4f})")
+    roc.set_xlabel('False Positive Rate')
+    roc.set_ylabel('True Positive Rate')
+    pr.step(recall, precision, where='post')
+    pr.set_title(f"Precision-Recall (AP {evaluation.average_precision():.4f})")
+    pr.set_xlabel('Recall')
+    pr.set_ylabel('Precision')
+    plt.show()
+
+def graph_evaluation(evaluation, chart='metrics'):
+    if chart == 'curves':
+        graph_curves(evaluation)
+    else:
+        graph_report(evaluation.classification_report(output_dict=True))
+
+def visualize_feature_importance(model, X_train, top_n=10):
+    feature_importance = model.feature_importances_
+    sorted_idx = np.argsort(feature_importance)[::-1]
+    feature_names = X_train.columns
+
+    plt.figure(figsize=(10, 6))
+    plt.bar(range(top_n), feature_importance[sorted_idx[:top_n]], align='center')
+    plt.xticks(range(top_n), feature_names[sorted_idx[:top_n]], rotation=45)
+    plt.title("Top {} Most Important Features".format(top_n))
+    plt.xlabel('Features')
+    plt.ylabel('Importance')
+    plt.show()
+
+if __name__ == "__main__":
+    from urlmodel.evaluate import Evaluation, print_evaluation
+
+    parser = argparse.ArgumentParser(description="Draw the charts of a saved evaluation, no model needed")
+    parser.add_argument('evaluation', help="json written by urlmodel.train --output or urlmodel.evaluate --output")
+    parser.add_argument('--chart', choices=['metrics', 'curves'], nargs='+', default=['metrics', 'curves'])
+    args = parser.parse_args()
+
+    evaluation = Evaluation.load(args.evaluation)
+    print_evaluation(evaluation)
+    for chart in args.chart:
+        graph_evaluation(evaluation, chart)
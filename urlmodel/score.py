@@ -0,0 +1,95 @@
+#Scores urls with a saved model artifact, one url per line from a file or
+#stdin. Nothing is retrained and no plotting libraries are imported. Only
+#the standard library is imported up front: numpy, pandas, sklearn and the
+#model are loaded by load_artifact and the first batch scored, so batch
+#workers and command line runs that exit early do not pay for them
+#
+#  python -m urlmodel.score model_artifact urls.txt --index known_domains
+
+import argparse
+import sys
+from itertools import islice
+
+BATCH_LINES = 10_000  # urls scored per call to the model
+
+def load_artifact(model_dir): #saved artifact, random forests compiled for fast small batches
+    from urlmodel.artifacts import load_model
+    from urlmodel.compiled_forest import compile_artifact
+    return compile_artifact(load_model(model_dir))
+
+def load_index(index_dir):
+    from urlmodel.domain_index import KnownDomainIndex
+    return KnownDomainIndex(index_dir)
+
+def predict_urls(artifact, urls, index=None): #returns (labels, probability of malicious or None)
+    import numpy as np #for data analysis
+    from urlmodel.artifacts import prepare_features
+
+    # urls the known domain index has a label for are answered from it, only
+    # the rest are featurized and go through the model
+    if index is not None:
+        known = index.lookup_batch(urls)
+        misses = np.flatnonzero(known < 0)
+        if len(misses) < len(known):
+            labels = known.astype(artifact.model.classes_.dtype)
+            probabilities = known.astype(np.float64)
+            if len(misses):
+                miss_labels, miss_probabilities = predict_urls(artifact, [urls[i] for i in misses])
+                labels[misses] = miss_labels
+                if miss_probabilities is None:
+                    probabilities = None
+                else:
+                    probabilities[misses] = miss_probabilities
+            return labels, probabilities
+    X = prepare_features(artifact, urls)
+    if not hasattr(artifact.model, 'predict_proba'):
+        return artifact.model.predict(X), None
+    # One model call: predict is the argmax of predict_proba for both forests and xgboost
+    proba = artifact.model.predict_proba(X)
+    classes = list(artifact.model.classes_)
+    labels = artifact.model.classes_.take(proba.argmax(axis=1))
+    probabilities = proba[:, classes.index(1)] if 1 in classes else None
+    return labels, probabilities
+
+def score_stream(artifact, lines, out, index=None):
+    lines = iter(lines)
+    while True:
+        batch = list(islice(lines, BATCH_LINES))
+        if not batch:
+            break
+        urls = [url for url in (line.strip() for line in batch) if url]
+        if not urls:
+            continue
+        labels, probabilities = predict_urls(artifact, urls, index)
+        for i, url in enumerate(urls):
+            if probabilities is None:
+                out.write(f"{url}\t{labels[i]:g}\n")
+            else:
+                out.write(f"{url}\t{labels[i]:g}\t{probabilities[i]:.4f}\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score urls with a saved model artifact")
+    parser.add_argument('model_dir')
+    parser.add_argument('urls_file', nargs='?', help="one url per line, stdin when left out")
+    parser.add_argument('--index', help="known domain index (urlmodel.domain_index) to answer labeled urls from")
+    args = parser.parse_args(argv)
+
+    try:
+        artifact = load_artifact(args.model_dir)
+    except FileNotFoundError:
+        print(f"No model artifact found in {args.model_dir}")
+        sys.exit(1)
+    index = load_index(args.index) if args.index else None
+
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            score_stream(artifact, f, sys.stdout, index)
+    else:
+        score_stream(artifact, sys.stdin, sys.stdout, index)
+    if index is not None:
+        stats = index.stats()
+        print(f"Known domain index answered {stats['index_url_hits'] + stats['index_domain_hits']} of"
+              f" {stats['index_lookups']} urls (hit rate {stats['index_hit_rate'] or 0:.1%})", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#Trains and evaluates the url classifier. One pipeline for every model:
+#features from urlmodel.extract, a fit, one scoring pass of the test rows by
+#urlmodel.evaluate, optionally a saved artifact for scoring and charts drawn
+#from that evaluation. xgboost and matplotlib are only imported when the run
+#asks for them
+#
+#  python -m urlmodel.train cleaned_data.csv --model xgb --output model_artifact_xgb
+
+import argparse
+import os
+import sys
+import time
+
+from sklearn.ensemble import RandomForestClassifier
+
+from urlmodel import instrumentation
+from urlmodel.evaluate import evaluate, print_evaluation
+from urlmodel.extract import LABEL_MODES, preprocess_data
+from urlmodel.instrumentation import stage
+
+#model: label mode it was built around
+MODELS = {
+    'rf': 'numeric',  # random forest
+    'rf_balanced': 'binary',  # random forest, classes weighted to the same total
+    'xgb': 'encoded',  # xgboost
+}
+PLOTS = ('metrics', 'curves', 'importance')
+EVALUATION_FILE = 'evaluation.json'  # saved next to the model artifact
+
+def make_model(kind='rf'):
+    if kind == 'xgb':
+        from xgboost import XGBClassifier
+        return XGBClassifier(n_estimators=100, random_state=42)
+    if kind == 'rf_balanced':
+        # Balancing the data: every class gets the same total weight, which is
+        # what oversampling the minority class amounts to, without copying rows.
+        # The bootstrap of each tree is drawn as per row counts too
+        return RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=42)
+    if kind == 'rf':
+        #estimators is number of trees generated
+        return RandomForestClassifier(n_estimators=100, random_state=42)
+    raise ValueError(f"Unknown model {kind!r}, expected one of {tuple(MODELS)}")
+
+def train_model(X_train, y_train, kind='rf'):
+    try:
+        model = make_model(kind)
+        with stage('train', rows=len(X_train)):
+            model.fit(X_train, y_train)
+        return model
+    except Exception as e:
+        print(f"Failed to train model: {e}")
+        raise
+
+def evaluate_model(model, X_test, y_test): #prints the report, returns the Evaluation
+    try:
+        with stage('evaluate', rows=X_test.shape[0]):
+            evaluation = evaluate(model, X_test, y_test)
+        print_evaluation(evaluation)
+        return evaluation
+    except Exception as e:
+        print(f"Failed to evaluate model: {e}")
+        raise
+
+def run(filename, kind='rf', labels=None, model_dir=None, plot=None, trace_file=None):
+    # The whole pipeline. The stage report and trace are written when
+    # instrumentation is on (enable() or URL_TRACE=1)
+    from urlmodel.artifacts import save_model
+
+    started = time.time()
+    X_train, X_test, y_train, y_test, scaler = preprocess_data(filename, labels or MODELS[kind], return_scaler=True)
+    model = train_model(X_train, y_train, kind)
+    if model_dir:
+        save_model(model_dir, model, scaler, list(X_train.columns))
+    evaluation = evaluate_model(model, X_test, y_test)
+    if model_dir:
+        evaluation.save(os.path.join(model_dir, EVALUATION_FILE))
+    print(f"Execution time: {time.time() - started} seconds")
+    if instrumentation.is_enabled():
+        # Memory and time per stage were recorded during the run above
+        instrumentation.report()
+        trace_file = trace_file or f"pipeline_trace_{kind}.json"
+        instrumentation.write_trace(trace_file)
+        print(f"Stage trace written to {trace_file}")
+    if plot in ('metrics', 'curves'):
+        from urlmodel.plot import graph_evaluation
+        graph_evaluation(evaluation, plot)
+    elif plot == 'importance':
+        from urlmodel.plot import visualize_feature_importance
+        visualize_feature_importance(model, X_train, top_n=9)  # Top 9 features
+    return model
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and evaluate a url classifier")
+    parser.add_argument('filename', nargs='?', default='cleaned_data.csv')
+    parser.add_argument('--model', choices=list(MODELS), default='rf')
+    parser.add_argument('--labels', choices=LABEL_MODES, help="label handling, default the one of the model")
+    parser.add_argument('--output', help="directory to save the model artifact to, for predict.py")
+    parser.add_argument('--plot', choices=PLOTS)
+    parser.add_argument('--trace', action='store_true', help="report time and memory per stage")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        instrumentation.enable()
+    try:
+        run(args.filename, args.model, args.labels, args.output, args.plot)
+    except FileNotFoundError:
+        print(f"The file {args.filename} was not found.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()